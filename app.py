@@ -9,8 +9,9 @@ from dash import html, dcc
 from dash.dependencies import Input, Output, State
 import dash_bootstrap_components as dbc
 import json
+from concurrent.futures import TimeoutError as FetchTimeoutError
 from dash_extensions.javascript import assign, arrow_function
-import geopandas as gpd
+from flask import abort, send_file
 
 # from geopy.geocoders import Nominatim
 import warnings
@@ -35,72 +36,124 @@ if current_dir in ("notebooks", "src"):
     if parent_dir not in sys.path:
         sys.path.append(parent_dir)
 
+if "src" not in sys.path:
+    sys.path.append("src")
 
-from src.poi_queries import (
-    groceries_from_placename,
-    convenience_from_placename,
-    lowquality_from_placename,
+
+from poi_queries import food_pois_from_placename
+from tract_store import (
+    classified_variables,
+    load_tract_store,
+    tracts_for_state,
+    tracts_in_bounds,
+    tract_at_point,
+    tracts_at_zoom,
+    to_feature_collection,
+)
+from state_resolver import state_from_point
+from choropleth_tiles import (
+    COLORSCALE,
+    CLASSIFICATION_SCHEME,
+    CLASSIFICATION_SCHEMES,
+    INITIAL_SVI_VARIABLE,
+    svi_classes,
+    tile_path,
 )
+from fetch_layer import fetch, submit
+from persistent_cache import normalise_text
+from geocoding import geocode, geocode_to_gdf
 
 
 first_time = True
 DEFAULT_PLACENAME = "Denver, CO"
 DEFAULT_SVI_VARIABLE = "E_POV150"
 LEAFLET_CRS = 3857
+MAP_HEIGHT_PX = 600
+MAX_ZOOM = 20
+# render the choropleth from cached server-side tiles instead of one big GeoJSON layer
+CHOROPLETH_TILES = True
+TILE_URL = "/tiles/svi/{scheme}/{svi}/{{z}}/{{x}}/{{y}}.png"
+# group nearby stores into cluster markers, useful for very large cities
+CLUSTER_MARKERS = False
+GEOCODE_TIMEOUT_S = 30
+POI_TIMEOUT_S = 120
 # Dash app setup
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 server = app.server
+load_tract_store()
+
+
+@server.route("/tiles/svi/<scheme>/<svi_variable>/<int:z>/<int:x>/<int:y>.png")
+def svi_tile(scheme, svi_variable, z, x, y):
+    if scheme not in CLASSIFICATION_SCHEMES:
+        abort(404)
+    if svi_variable not in classified_variables():
+        abort(404)
+    if not 0 <= z <= MAX_ZOOM or not (0 <= x < 2**z and 0 <= y < 2**z):
+        abort(404)
+    return send_file(
+        tile_path(svi_variable, z, x, y, scheme=scheme), mimetype="image/png"
+    )
 
 
-def clean_invalid_values(geojson, invalid_value=-999):
-    for record in geojson["features"]:
-        for key in record["properties"].keys():
-            if record["properties"][key] == -999:
-                record["properties"][key] = np.nan
-    return geojson
-
-
-# Load GeoJSON data from file
-def create_geo_json_data(location_state, gdf=False):
-    filename = f"geo_json_{location_state.lower()}.json"
-    primary_path = os.path.join("data", filename)
-    fallback_path = os.path.join("src", "data", filename)
-    for file_path in [primary_path, fallback_path]:
-        try:
-            if gdf:
-                return gpd.from_file(file_path)
-            with open(file_path) as f:
-                geojson_data = json.load(f)
-                # Clean invalid values after loading
-                return clean_invalid_values(geojson_data)
-
-        except FileNotFoundError:
-            continue
-
-    # If we get here, neither path worked
-    raise FileNotFoundError(
-        f"Could not find GeoJSON file for state {location_state} "
-        f"in either {primary_path} or {fallback_path}"
-    )
+# Slice the state's tracts out of the preloaded tract store, optionally limited to
+# the tracts visible in (minx, miny, maxx, maxy) bounds and simplified for the zoom.
+# Passing svi_variable ships only that property and FIPS instead of all ~150 of them.
+def create_geo_json_data(
+    location_state, gdf=False, bounds=None, zoom=MAX_ZOOM, svi_variable=None
+):
+    if bounds is None:
+        tracts = tracts_for_state(location_state)
+    else:
+        tracts = tracts_in_bounds(location_state, bounds)
+    if gdf:
+        return tracts
+    columns = None if svi_variable is None else ["FIPS", svi_variable]
+    return to_feature_collection(tracts_at_zoom(tracts, zoom, columns=columns))
+
+
+def viewport_zoom(viewport):
+    if "zoom" in viewport:
+        return viewport["zoom"]
+    # fitBounds picks the highest zoom at which the bounds fit, estimate it from the
+    # map height since the width depends on the browser window
+    (south, _), (north, _) = viewport["bounds"]
+    mercator_y = np.log(np.tan(np.pi / 4 + np.radians([south, north]) / 2))
+    world_fraction = (mercator_y[1] - mercator_y[0]) / (2 * np.pi)
+    if world_fraction <= 0:
+        return MAX_ZOOM
+    return min(np.log2(MAP_HEIGHT_PX / 256 / world_fraction), MAX_ZOOM)
+
+
+# Draw every store of a tier as a circle marker on the map's canvas renderer
+point_to_circle = assign(
+    """function(feature, latlng, context){
+    const {color, radius} = context.hideout;  // one style per tier, not per store
+    return L.circleMarker(latlng, {color: color, radius: radius, fill: true, fillOpacity: 0.5});
+}"""
+)
 
 
-# Helper to convert POI GeoDataFrame to leaflet markers
+# Helper to convert POI GeoDataFrame to a single leaflet GeoJSON layer
 def poi_to_markers(poi_gdf, color, radius):
-    # print("POI Geometry:", poi_gdf["geometry"].head())  # Debugging
-    markers = [
-        dl.CircleMarker(
-            center=[
-                geom.y,
-                geom.x,
-            ],  # Extract latitude (y) and longitude (x) from the geometry
-            color=color,
-            radius=radius,
-            fill=True,
-            fillOpacity=0.5,
-        )
-        for geom in poi_gdf.geometry
+    # only the coordinates are shipped, rounded to ~10cm
+    coordinates = np.column_stack([poi_gdf.geometry.x, poi_gdf.geometry.y]).round(6)
+    features = [
+        {
+            "type": "Feature",
+            "properties": {},
+            "geometry": {"type": "Point", "coordinates": point},
+        }
+        for point in coordinates.tolist()
     ]
-    return markers
+    return dl.GeoJSON(
+        data={"type": "FeatureCollection", "features": features},
+        pointToLayer=point_to_circle,
+        hideout=dict(color=color, radius=radius),
+        cluster=CLUSTER_MARKERS,
+        zoomToBoundsOnClick=CLUSTER_MARKERS,
+        superClusterOptions=dict(radius=50, maxZoom=15),
+    )
 
 
 def find_center_of_location(grocery):
@@ -110,58 +163,21 @@ def find_center_of_location(grocery):
 
 
 def find_state(center):
+    # resolved locally against the state outlines, returns None outside known states
+    return state_from_point(lat=center[0], lon=center[1])
 
-    url = f"https://nominatim.openstreetmap.org/reverse?format=json&lat={center[0]}&lon={center[1]}&zoom=10&addressdetails=1"
-    response = requests.get(url, headers=headers)
-    data = response.json()
-    address = data.get("address", {})
-    state_code = address.get("ISO3166-2-lvl4", "").split("-")[-1]
-
-    return state_code
 
+def generate_style_handle(svi, location_state, scheme=CLASSIFICATION_SCHEME):
 
-def generate_style_handle(svi, geojson_data):
-
-    if svi == "POP_DENSITY":
-        e_totpop = [
-            feature["properties"]["E_TOTPOP"] for feature in geojson_data["features"]
-        ]
-        area_sqmi = [
-            feature["properties"]["AREA_SQMI"] for feature in geojson_data["features"]
-        ]
-        properties_values = [a / b for a, b in zip(e_totpop, area_sqmi)]
-    else:
-        properties_values = [
-            feature["properties"][svi]
-            for feature in geojson_data["features"]
-            if feature["properties"][svi] != -999
-        ]
-    if svi.startswith("E_"):
-        properties_max = max(properties_values)
-    elif svi.startswith("EPL_") or svi.startswith("RPL_") or svi.startswith("EP_"):
-        properties_max = 1.0
-    properties_min = 0  # min(properties_values)
-    colorscale = [
-        "#FFEDA0",
-        "#FED976",
-        "#FEB24C",
-        "#FD8D3C",
-        "#FC4E2A",
-        "#E31A1C",
-        "#BD0026",
-        "#800026",
-        
-    ]
-
-    classes = np.linspace(
-        properties_min, properties_max * 1.001, len(colorscale) + 1
-    ).tolist()
+    # class breaks are an O(1) lookup in the precomputed statistics table
+    classes, properties_min, properties_max = svi_classes(svi, location_state, scheme)
+    colorscale = COLORSCALE
 
     style = dict(weight=2, opacity=0.2, color="white", dashArray="3", fillOpacity=0.7)
 
     colorbar = dl.Colorbar(
         id="colorbar",
-        classes=len(colorscale),
+        classes=classes,
         colorscale=colorscale,
         width=400,
         height=10,
@@ -193,6 +209,21 @@ def generate_style_handle(svi, geojson_data):
     return style_handle, colorscale, classes, style, colorbar
 
 
+# look up the tract under a map click, shaped like a GeoJSON feature for get_info
+def find_tract_feature(click_data, svi_variable):
+    if not click_data or svi_variable == "None":
+        return None
+    lat, lon = click_data["latlng"]["lat"], click_data["latlng"]["lng"]
+    location_state = find_state([lat, lon])
+    if location_state is None:
+        return None
+    tract = tract_at_point(location_state, lat, lon)
+    if tract is None:
+        return None
+    value = tract[svi_variable]
+    return {"properties": {svi_variable: None if np.isnan(value) else value}}
+
+
 # create tooltip
 def get_info(feature=None, svi_variable="E_TOTPOP"):
     # header = [html.B("SVI Hover Display", style={"fontSize":"14px"}), html.Br()]
@@ -226,8 +257,9 @@ def init_map():
     return dl.Map(
         id="map",
         zoom=12,
-        center=ox.geocode(DEFAULT_PLACENAME),
-        style={"width": "100%", "height": "600px"},
+        center=geocode(DEFAULT_PLACENAME),
+        preferCanvas=True,
+        style={"width": "100%", "height": f"{MAP_HEIGHT_PX}px"},
         children=[
             # Base tile layer (bottom)
             dl.Pane(
@@ -397,15 +429,26 @@ def init_map():
     Output("failed-search", "is_open"),
     Output("failed-search", "children"),
     Input("location-input", "n_submit"),
-    Input("SVI-val-dropdown", "value"),
     State("location-input", "value"),
 )
-def fly_to_place(n_submit, _, placename):
+def fly_to_place(n_submit, placename):
     if not n_submit:
         placename = DEFAULT_PLACENAME
 
+    # start the store query alongside the geocode, update_map_markers joins it later
+    submit(
+        ("food_pois", normalise_text(placename)),
+        food_pois_from_placename,
+        placename,
+        centroids_only=True,
+    )
     try:
-        gdf = ox.geocode_to_gdf(placename)
+        gdf = fetch(
+            ("boundary", normalise_text(placename)),
+            geocode_to_gdf,
+            placename,
+            timeout=GEOCODE_TIMEOUT_S,
+        )
 
     except Exception as e:
         print(f"Error geocoding {placename}: {e}")
@@ -445,58 +488,90 @@ def fly_to_place(n_submit, _, placename):
     Output("convenience-layer", "children"),
     Output("lowquality-layer", "children"),
     Input("location-input", "n_submit"),
-    Input("SVI-val-dropdown", "value"),
     Input("failed-search", "is_open"),
     State("location-input", "value"),
 )
-def update_map_markers(n_submit, _, failed_search, placename):
-    # throwaway the svi value, but use the trigger
+def update_map_markers(n_submit, failed_search, placename):
+    # only a new place needs new stores, switching SVI variables keeps the markers
     if failed_search:
         return dash.no_update, dash.no_update, dash.no_update
     try:
-        grocery = groceries_from_placename(placename, centroids_only=True)
-        convenience = convenience_from_placename(placename, centroids_only=True)
-        lowquality = lowquality_from_placename(placename, centroids_only=True)
-    except ox._errors.InsufficientResponseError as e:
-        print(e)
+        # one Overpass round-trip for all three tiers, usually already started by fly_to_place
+        pois = fetch(
+            ("food_pois", normalise_text(placename)),
+            food_pois_from_placename,
+            placename,
+            centroids_only=True,
+            timeout=POI_TIMEOUT_S,
+        )
+    except (ox._errors.InsufficientResponseError, FetchTimeoutError) as e:
+        print(f"Error fetching stores for {placename}: {e!r}")
         return dash.no_update, dash.no_update, dash.no_update
 
     return (
-        poi_to_markers(grocery, color="#4daf4a", radius=10),
-        poi_to_markers(convenience, color="#377eb8", radius=6),
-        poi_to_markers(lowquality, color="#e41a1c", radius=3),
+        poi_to_markers(pois[pois["label"] == "Grocery"], color="#4daf4a", radius=10),
+        poi_to_markers(
+            pois[pois["label"] == "Convenience"], color="#377eb8", radius=6
+        ),
+        poi_to_markers(pois[pois["label"] == "Low Quality"], color="#e41a1c", radius=3),
     )
 
 
 @app.callback(
     Output("choropleth-layer", "children"),
     Output("colorbar-container", "children"),
-    Input("location-input", "n_submit"),
     Input("SVI-val-dropdown", "value"),
     Input("failed-search", "is_open"),
-    Input("map", "viewport"),
-    State("location-input", "value"),
+    Input("map", "bounds"),
+    Input("map", "zoom"),
+    State("map", "viewport"),
 )
-def update_choropleth(n_submit, svi_variable, failed_search, viewport, _):
+def update_choropleth(svi_variable, failed_search, map_bounds, map_zoom, viewport):
+    # a new search reaches this callback when the map settles on the viewport set
+    # by fly_to_place, and so does every pan and zoom, so switching SVI variables
+    # never geocodes or refetches stores
     if failed_search:
         return dash.no_update, dash.no_update
 
     if svi_variable == "None":
         return [], []
 
-    # SVI update is now triggered by change in viewport
-    bounds = np.array(viewport["bounds"])
+    # SVI update is now triggered by the map moving
+    if map_bounds is None:
+        # the map has not reported a move yet, use the viewport it was sent to
+        if viewport is None:
+            return dash.no_update, dash.no_update
+        map_bounds, map_zoom = viewport["bounds"], viewport_zoom(viewport)
+    if map_zoom is None:
+        map_zoom = viewport_zoom({"bounds": map_bounds})
+    bounds = np.array(map_bounds)
     center = bounds.mean(axis=0)
 
     # Get center and state
     location_state = find_state(center)
+    if location_state is None:
+        return [], []
 
-    # Create choropleth
-    geo_json_data = create_geo_json_data(location_state)
-
+    # Classes come from the whole state so colours stay put while panning,
+    # but only the tracts in view (plus a margin) are sent to the browser
     style_handle, colorscale, classes, style, colorbar = generate_style_handle(
-        svi_variable, geo_json_data
+        svi_variable, location_state
     )
+    if CHOROPLETH_TILES:
+        choropleth = dl.TileLayer(
+            url=TILE_URL.format(scheme=CLASSIFICATION_SCHEME, svi=svi_variable),
+            maxZoom=MAX_ZOOM,
+        )
+        return choropleth, colorbar
+
+    south_west, north_east = bounds
+    geo_json_data = create_geo_json_data(
+        location_state,
+        bounds=(south_west[1], south_west[0], north_east[1], north_east[0]),
+        zoom=map_zoom,
+        svi_variable=svi_variable,
+    )
+
     # mapping geojson to styler to fills in the choropleth
     choropleth = dl.GeoJSON(
         data=geo_json_data,
@@ -686,7 +761,7 @@ app.layout = dbc.Container(
                                             "value": "None",
                                         },
                                     ],
-                                    value="E_TOTPOP",
+                                    value=INITIAL_SVI_VARIABLE,
                                     className="mb-4",
                                     style=dict(
                                         width="100%", position="relative", zIndex=1000
@@ -718,10 +793,14 @@ app.layout = dbc.Container(
 @app.callback(
     Output("info_tooltip", "children"),
     Input("choropleth-layer", "hoverData"),
+    Input("map", "clickData"),
     Input("SVI-val-dropdown", "value"),
     prevent_initial_callbacks=True,
 )
-def info_hover(feature, svi_variable):
+def info_hover(feature, click_data, svi_variable):
+    # raster tiles carry no feature data, so the tooltip follows map clicks instead
+    if CHOROPLETH_TILES:
+        feature = find_tract_feature(click_data, svi_variable)
     return get_info(feature, svi_variable)
 
 
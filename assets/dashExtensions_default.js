@@ -1,6 +1,18 @@
 window.dashExtensions = Object.assign({}, window.dashExtensions, {
     default: {
-        function0: function(feature, context) {
+        function0: function(feature, latlng, context) {
+            const {
+                color,
+                radius
+            } = context.hideout; // one style per tier, not per store
+            return L.circleMarker(latlng, {
+                color: color,
+                radius: radius,
+                fill: true,
+                fillOpacity: 0.5
+            });
+        },
+        function1: function(feature, context) {
             const {
                 classes,
                 colorscale,
@@ -7,6 +7,7 @@ LONG_STATES = [
     "Colorado",
     "Connecticut",
     "Delaware",
+    "District of Columbia",
     "Florida",
     "Georgia",
     "Hawaii",
@@ -60,6 +61,7 @@ SHORT_STATES = [
     "CO",
     "CT",
     "DE",
+    "DC",
     "FL",
     "GA",
     "HI",
@@ -113,6 +115,7 @@ FIPS_STATES = [
     "08",
     "09",
     "10",
+    "11",
     "12",
     "13",
     "15",
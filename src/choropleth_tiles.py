@@ -0,0 +1,244 @@
+import os
+import sys
+import io
+import math
+import tempfile
+from functools import partial
+from pathlib import Path
+from typing import Callable
+import numpy as np
+import shapely
+from PIL import Image, ImageColor, ImageDraw
+
+TILE_SIZE = 256
+TILE_CACHE_PATH = Path("data", "processed", "tiles")
+COLORSCALE = [
+    "#FFEDA0",
+    "#FED976",
+    "#FEB24C",
+    "#FD8D3C",
+    "#FC4E2A",
+    "#E31A1C",
+    "#BD0026",
+    "#800026",
+]
+NULL_COLOR = "#808080"
+FILL_OPACITY = 0.7
+BORDER_OPACITY = 0.2
+CLASSIFICATION_SCHEMES = ("equal_interval", "quantile", "natural_breaks")
+# the dashboard's scheme and the variable it opens on, which the cache warm-up renders
+CLASSIFICATION_SCHEME = "equal_interval"
+INITIAL_SVI_VARIABLE = "E_TOTPOP"
+# statistics table column holding the stored class edges of each scheme
+SCHEME_EDGES = {"quantile": "quantiles", "natural_breaks": "natural_breaks"}
+
+if os.getcwd().endswith("notebooks") or os.getcwd().endswith("src"):
+    os.chdir("..")
+
+if "src" not in sys.path:
+    sys.path.append("src")
+
+from tract_store import (
+    TRACT_STORE_PATH,
+    svi_statistics,
+    tracts_in_bounds,
+    tracts_at_zoom,
+)
+from state_resolver import states_in_bounds
+
+
+def svi_classes(
+    svi: str, state: str, scheme: str = "equal_interval"
+) -> tuple[list[float], float, float]:
+    """
+    Look up the class breaks of an SVI variable over a whole state.
+
+    Breaks come from the precomputed statistics table, so no tract data is read.
+    The equal_interval scheme scales counts to the state's largest value and
+    percentiles to [0, 1]; quantile and natural_breaks use the stored edges.
+
+    Args:
+        svi (str): Name of the SVI variable.
+        state (str): Two-letter state abbreviation.
+        scheme (str, optional): One of CLASSIFICATION_SCHEMES. Defaults to "equal_interval".
+
+    Returns:
+        tuple: (class breaks, minimum, maximum) for the colorscale.
+    """
+    statistics = svi_statistics(state, svi)
+    if scheme == "equal_interval":
+        if svi.startswith("EPL_") or svi.startswith("RPL_") or svi.startswith("EP_"):
+            properties_max = 1.0
+        else:
+            properties_max = float(statistics["max"])
+        properties_min = 0  # min(properties_values)
+        classes = np.linspace(
+            properties_min, properties_max * 1.001, len(COLORSCALE) + 1
+        ).tolist()
+        return classes, properties_min, properties_max
+
+    if scheme not in CLASSIFICATION_SCHEMES:
+        raise ValueError(f"Unknown classification scheme {scheme}")
+    classes = np.asarray(statistics[SCHEME_EDGES[scheme]], dtype=float).tolist()
+    # the top edge is exclusive when colouring, nudge it so the maximum is included
+    classes[-1] = float(np.nextafter(classes[-1], np.inf))
+    return classes, float(statistics["min"]), float(statistics["max"])
+
+
+def tile_bounds(z: int, x: int, y: int) -> tuple[float, float, float, float]:
+    """
+    Convert slippy-map tile coordinates to (minx, miny, maxx, maxy) in longitude and latitude.
+    """
+    n = 2**z
+
+    def tile_lat(tile_y):
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * tile_y / n))))
+
+    return x / n * 360 - 180, tile_lat(y + 1), (x + 1) / n * 360 - 180, tile_lat(y)
+
+
+def tiles_in_bounds(
+    bounds: tuple[float, float, float, float], z: int
+) -> list[tuple[int, int]]:
+    """
+    List the (x, y) slippy-map tiles of a zoom level covering a longitude and latitude box.
+    """
+    minx, miny, maxx, maxy = bounds
+    n = 2**z
+
+    def tile_x(lon):
+        return min(max(int((lon + 180) / 360 * n), 0), n - 1)
+
+    def tile_y(lat):
+        lat = math.radians(lat)
+        y = (1 - math.log(math.tan(lat) + 1 / math.cos(lat)) / math.pi) / 2 * n
+        return min(max(int(y), 0), n - 1)
+
+    return [
+        (x, y)
+        for x in range(tile_x(minx), tile_x(maxx) + 1)
+        for y in range(tile_y(maxy), tile_y(miny) + 1)
+    ]
+
+
+def _to_pixels(coords: np.ndarray, z: int, x: int, y: int) -> np.ndarray:
+    """
+    Project longitude and latitude pairs to pixel positions within a web mercator tile.
+    """
+    scale = TILE_SIZE * 2**z
+    lon, lat = coords[:, 0], np.radians(coords[:, 1])
+    px = (lon + 180) / 360 * scale - x * TILE_SIZE
+    py = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / math.pi) / 2 * scale
+    return np.column_stack([px, py - y * TILE_SIZE])
+
+
+def _rgba(color: str, opacity: float) -> tuple[int, int, int, int]:
+    return (*ImageColor.getrgb(color), round(255 * opacity))
+
+
+def render_tile(
+    svi: str, z: int, x: int, y: int, scheme: str = "equal_interval"
+) -> bytes:
+    """
+    Render one choropleth tile of an SVI variable as a transparent PNG.
+
+    Every tract is coloured with the class breaks of its own state, so tiles that
+    straddle a state line match the GeoJSON choropleth on either side.
+
+    Args:
+        svi (str): Name of the SVI variable.
+        z (int): Zoom level.
+        x (int): Tile column.
+        y (int): Tile row.
+        scheme (str, optional): Classification scheme. Defaults to "equal_interval".
+
+    Returns:
+        bytes: The encoded PNG.
+    """
+    image = Image.new("RGBA", (TILE_SIZE, TILE_SIZE), (0, 0, 0, 0))
+    fill = ImageDraw.Draw(image)
+    border = ImageDraw.Draw(image, "RGBA")
+    colors = [_rgba(color, FILL_OPACITY) for color in COLORSCALE]
+    null_color = _rgba(NULL_COLOR, FILL_OPACITY)
+    border_color = _rgba("white", BORDER_OPACITY)
+
+    bounds = tile_bounds(z, x, y)
+    for state in states_in_bounds(bounds):
+        tracts = tracts_at_zoom(
+            tracts_in_bounds(state, bounds, margin=0), z, columns=[svi]
+        )
+        if tracts.empty:
+            continue
+        classes, _, _ = svi_classes(svi, state, scheme)
+        values = tracts[svi].to_numpy(dtype=float)
+        class_index = np.searchsorted(classes, values, side="right")
+
+        # Largest first, so enclaves are drawn on top of the holes they fill
+        polygons = shapely.get_parts(tracts.geometry.values, return_index=True)
+        order = np.argsort(-shapely.area(polygons[0]))
+        for polygon, tract in zip(polygons[0][order], polygons[1][order]):
+            if np.isnan(values[tract]):
+                color = null_color
+            else:
+                color = colors[min(max(class_index[tract] - 1, 0), len(colors) - 1)]
+            exterior = _to_pixels(shapely.get_coordinates(polygon.exterior), z, x, y)
+            fill.polygon(exterior.ravel().tolist(), fill=color)
+            for interior in polygon.interiors:
+                hole = _to_pixels(shapely.get_coordinates(interior), z, x, y)
+                fill.polygon(hole.ravel().tolist(), fill=(0, 0, 0, 0))
+            border.line(exterior.ravel().tolist(), fill=border_color, width=1)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def _cached_tile(path: Path, render: Callable[[], bytes]) -> Path:
+    """
+    Render a tile to path unless it is already there.
+    """
+    if not path.exists():
+        tile = render()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write then rename so concurrent workers never serve a partial tile,
+        # under a unique name as threads of one process may render the same tile
+        with tempfile.NamedTemporaryFile(
+            dir=path.parent, suffix=".tmp", delete=False
+        ) as partial_tile:
+            partial_tile.write(tile)
+        os.replace(partial_tile.name, path)
+    return path
+
+
+def tile_path(
+    svi: str,
+    z: int,
+    x: int,
+    y: int,
+    scheme: str = "equal_interval",
+    cache_path: Path = TILE_CACHE_PATH,
+) -> Path:
+    """
+    Get the on-disk location of a tile, rendering and caching it on a miss.
+
+    The cache is keyed on the modification time of the tract store so that
+    rebuilding the store never serves stale tiles. Tiles outside every state
+    all share one transparent file, so requests for them never grow the cache.
+
+    Args:
+        svi (str): Name of the SVI variable.
+        z (int): Zoom level.
+        x (int): Tile column.
+        y (int): Tile row.
+        scheme (str, optional): Classification scheme. Defaults to "equal_interval".
+        cache_path (Path, optional): Root directory of the tile cache.
+
+    Returns:
+        Path: Path to the cached PNG.
+    """
+    render = partial(render_tile, svi, z, x, y, scheme)
+    if not states_in_bounds(tile_bounds(z, x, y)):
+        return _cached_tile(Path(cache_path, "empty.png"), render)
+    store_version = str(int(TRACT_STORE_PATH.stat().st_mtime))
+    path = Path(cache_path, store_version, scheme, svi, str(z), str(x), f"{y}.png")
+    return _cached_tile(path, render)
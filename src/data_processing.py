@@ -2,7 +2,6 @@ from functools import reduce, cache, wraps
 import pandas as pd
 import geopandas as gpd
 import osmnx as ox
-import networkx as nx
 import os
 import sys
 from pathlib import Path
@@ -11,7 +10,6 @@ import numpy as np
 import time
 import hashlib
 import pickle
-import igraph as ig
 from warnings import warn
 import requests
 
@@ -26,7 +24,19 @@ if "src" not in sys.path:
     sys.path.append("src")
 
 from street_networks import road_network_from_polygon
-from poi_queries import create_circular_polygon
+from poi_queries import PRIMARY, create_circular_polygons, features_from_polygon
+from geocoding import geocode
+from graph_metrics import (
+    BETWEENNESS_SAMPLES,
+    BETWEENNESS_WORKERS,
+    approximate_betweenness,
+    compact_graph,
+    edge_average,
+    nearest_other_sources,
+    nearest_sources,
+    pagerank,
+    weight_matrix,
+)
 
 
 def timer(func):
@@ -116,9 +126,7 @@ def fetch_graph(polygon):
 @timer
 @cache
 def fetch_groceries(polygon):
-    groceries = ox.features_from_polygon(
-        polygon, tags={"shop": "supermarket"}
-    ).reset_index()
+    groceries = features_from_polygon(polygon, tags=PRIMARY).reset_index()
 
     groceries = groceries[["osmid", "geometry"]].assign(grocery=True)
     return groceries
@@ -222,104 +230,69 @@ def merge_svi(nodes, svi, svi_fields=["density"]):
 
 
 @timer
-def add_grocery_travel_time(graph, igraph=True):
-    if igraph:
-        return add_grocery_travel_time_igraph(graph)
-    grocery_node_ids = [
-        node for node, attr in graph.nodes(data=True) if attr.get("grocery", False)
-    ]
-
-    shortest_paths_to_grocery = nx.multi_source_dijkstra_path_length(
-        graph, sources=grocery_node_ids, weight="travel_time"
-    )
-
-    # Replace zero distances with distance to nearest other grocery store
-    for node in grocery_node_ids:
-        # If this node has a zero distance (distance to itself)
-        if shortest_paths_to_grocery[node] == 0:
-            # Calculate paths from this specific node
-            shortest_paths = nx.single_source_dijkstra_path_length(
-                graph, node, weight="travel_time"
-            )
-
-            # Get distances to other grocery nodes only
-            non_self_distances = {
-                target: dist
-                for target, dist in shortest_paths.items()
-                if target in grocery_node_ids and target != node
-            }
-
-            # Replace the zero distance with distance to nearest other grocery store
-            if non_self_distances:
-                shortest_paths_to_grocery[node] = min(non_self_distances.values())
-    nx.set_node_attributes(graph, shortest_paths_to_grocery, "nearest_grocery_time")
-    return graph
+def add_grocery_travel_time(nodes, graph):
+    # Sparse matrix of travel times, parallel edges reduced to the fastest
+    adjacency = weight_matrix(graph)
 
-
-@timer
-def add_grocery_travel_time_igraph(graph):
-    # Convert to igraph
-    ig_graph = ig.Graph.from_networkx(graph)
-
-    # For street networks, we want paths TO grocery stores
-    # Since we're calculating from grocery stores, use 'in' to respect one-way streets
-    mode = "in" if ig_graph.is_directed() else "all"
-
-    # Get the vertex indices of grocery stores
-    node_to_idx = {name: idx for idx, name in enumerate(ig_graph.vs["_nx_name"])}
-    idx_to_node = {idx: name for name, idx in node_to_idx.items()}
-    grocery_indices = [
-        node_to_idx[node]
-        for node, attr in graph.nodes(data=True)
-        if attr.get("grocery", False)
-    ]
-
-    if not grocery_indices:
+    grocery_indices = np.flatnonzero(nodes["grocery"].to_numpy(dtype=bool))
+    if not len(grocery_indices):
         warn("No grocery stores found in graph!")
-        return graph
+        return nodes
 
-    # Calculate shortest paths TO grocery stores by calculating backwards
-    shortest_paths = ig_graph.shortest_paths(
-        source=grocery_indices, weights="travel_time", mode=mode
+    # Nearest store of every node in one Dijkstra TO the stores, respecting
+    # one-way streets
+    shortest_paths_to_grocery, nearest_grocery = nearest_sources(
+        adjacency, grocery_indices
     )
 
-    # For each node (column), get minimum distance to any grocery store (rows)
-    shortest_paths_to_grocery = {
-        idx_to_node[j]: min(shortest_paths[i][j] for i in range(len(grocery_indices)))
-        for j in range(len(ig_graph.vs))
-    }
-
-    # For grocery stores themselves, find distance to nearest OTHER grocery store
-    for grocery_idx in grocery_indices:
-        node_name = idx_to_node[grocery_idx]
-        # Filter distances to all OTHER grocery stores
-        other_store_distances = [
-            shortest_paths[i][grocery_idx]
-            for i in range(len(grocery_indices))
-            if grocery_indices[i] != grocery_idx
-        ]
-        if other_store_distances:
-            shortest_paths_to_grocery[node_name] = min(other_store_distances)
-
-    nx.set_node_attributes(graph, shortest_paths_to_grocery, "nearest_grocery_time")
-    return graph
+    # For grocery stores themselves, use the nearest OTHER store
+    if len(grocery_indices) > 1:
+        (
+            shortest_paths_to_grocery[grocery_indices],
+            nearest_grocery[grocery_indices],
+        ) = nearest_other_sources(adjacency, grocery_indices)
+
+    node_ids = np.append(graph.nodes.to_numpy(dtype=object), None)  # -1 picks None
+    return nodes.assign(
+        nearest_grocery_time=shortest_paths_to_grocery,
+        nearest_grocery=node_ids[nearest_grocery],
+    )
 
 
 @timer
-def add_pagerank(graph):
-    nx.set_node_attributes(graph, nx.pagerank(graph), "pagerank")
-    return graph
+def add_pagerank(nodes, graph, nstart=None, weighted=False):
+    # nstart: earlier pagerank by node id, e.g. before a small edit of the graph
+    if nstart is not None:
+        nstart = pd.Series(nstart).reindex(graph.nodes)
+        nstart = nstart.fillna(nstart.mean()).fillna(1).to_numpy()
+    scores, iterations = pagerank(graph, weighted=weighted, nstart=nstart)
+    print(f"PageRank took {iterations} iterations")
+    return nodes.assign(pagerank=scores)
 
 
 @timer
-def add_betweenness(graph, k=500):
-    # print("start conversion to ig_graph")
-    ig_graph = ig.Graph.from_networkx(graph)
-    # print("converted to ig_graph")
-    btw = ig_graph.betweenness(weights="travel_time", cutoff=k)
-
-    nx.set_node_attributes(graph, dict(zip(graph.nodes(), btw)), "betweenness")
-    return graph
+def add_betweenness(
+    nodes,
+    graph,
+    k=BETWEENNESS_SAMPLES,
+    epsilon=None,
+    seed=0,
+    workers=BETWEENNESS_WORKERS,
+):
+    # k sampled sources, not a path length cutoff; k=None is exact
+    btw, standard_error = approximate_betweenness(
+        graph, k=k, epsilon=epsilon, seed=seed, workers=workers
+    )
+    nodes = nodes.assign(betweenness=btw)
+    # error relative to the most central node, the scale of the column; NaN when
+    # too few sources were sampled to estimate it
+    error = np.nan
+    if len(btw) and not np.isnan(standard_error).any():
+        error = float(standard_error.max() / btw.max()) if btw.max() > 0 else 0.0
+    if not np.isnan(error):
+        print(f"Betweenness relative standard error: {error:.2%}")
+    nodes.attrs["betweenness_error"] = error
+    return nodes
 
 
 @timer
@@ -420,15 +393,14 @@ def batch_process_cities(placenames):
 
 
 @timer
-def add_average_to_edge(graph, attribute):
-    for u, v, k in graph.edges(keys=True):
-
-        source_value = graph.nodes[u].get(attribute, np.nan)
-        target_value = graph.nodes[v].get(attribute, np.nan)
-        average_value = (source_value + target_value) / 2
-        graph.edges[u, v, k][attribute] = average_value
-
-    return graph
+def add_average_to_edge(nodes, edges, graph, attribute):
+    edges = edges.copy()
+    if attribute not in nodes.columns:
+        # nodes without the value blend to NaN, as on the networkx graph
+        edges[attribute] = np.nan
+        return edges
+    edges[attribute] = edge_average(graph, nodes[attribute].to_numpy(dtype=float))
+    return edges
 
 
 @timer
@@ -438,13 +410,10 @@ def data_from_placename(
 ):
 
     results = {}
-    center = ox.geocode(placename)
+    center = geocode(placename)
 
-    area_of_analysis = create_circular_polygon(
-        lat=center[0], lon=center[1], radius_m=radius_m
-    )
-    query_scope = create_circular_polygon(
-        lat=center[0], lon=center[1], radius_m=radius_m + buffer
+    area_of_analysis, query_scope = create_circular_polygons(
+        center[0], center[1], [radius_m, radius_m + buffer]
     )
 
     # three sources, two queries, one read from file
@@ -479,21 +448,21 @@ def data_from_placename(
         not nodes.index.duplicated().any()
     ), "Duplicate indices found in the nodes dataframe"
 
-    # rebuild graph
-    street_nx = ox.convert.graph_from_gdfs(nodes, edges)
+    # one array-backed graph shared by every metric
+    graph = compact_graph(nodes, edges)
 
     # Shortest grocery travel_times
-    street_nx = add_grocery_travel_time(street_nx)
+    nodes = add_grocery_travel_time(nodes, graph)
 
     # Adding pagerank
-    street_nx = add_pagerank(street_nx)
-    street_nx = add_betweenness(street_nx)
+    nodes = add_pagerank(nodes, graph)
+    nodes = add_betweenness(nodes, graph)
+    betweenness_error = nodes.attrs["betweenness_error"]
     assert "index_right" not in nodes.columns
     # blending node values for edges
-    street_nx = add_average_to_edge(street_nx, "nearest_grocery_time")
-    street_nx = add_average_to_edge(street_nx, "pagerank")
+    edges = add_average_to_edge(nodes, edges, graph, "nearest_grocery_time")
+    edges = add_average_to_edge(nodes, edges, graph, "pagerank")
 
-    nodes, edges = ox.graph_to_gdfs(street_nx)
     assert "index_right" not in nodes.columns
     # provide filters to get different levels of analysis
     nodes = nodes.assign(aoa=nodes.geometry.within(area_of_analysis))
@@ -576,6 +545,7 @@ def data_from_placename(
             "svi": svi,
             "nodes": nodes,
             "edges": edges,
+            "betweenness_error": betweenness_error,
         }
     )
     if return_dictionary:
@@ -0,0 +1,81 @@
+import os
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Hashable
+
+FETCH_WORKERS = 8
+FETCH_TIMEOUT_S = 90
+
+if os.getcwd().endswith("notebooks") or os.getcwd().endswith("src"):
+    os.chdir("..")
+
+if "src" not in sys.path:
+    sys.path.append("src")
+
+_executor = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="fetch")
+_in_flight: dict[Hashable, Future] = {}
+_lock = threading.Lock()
+
+
+def _forget(key: Hashable, future: Future) -> None:
+    with _lock:
+        if _in_flight.get(key) is future:
+            del _in_flight[key]
+
+
+def submit(key: Hashable, func: Callable, *args, **kwargs) -> Future:
+    """
+    Start a slow call in the background, joining an identical call already running.
+
+    Callbacks that need the same data (for example the POIs of a place, wanted
+    by both the search and the marker callbacks) share one request this way.
+    Finished calls are forgotten, repeat requests rely on the function's own cache.
+
+    Args:
+        key (Hashable): Identifies the call, equal keys must mean equal results.
+        func (Callable): The function to run.
+        *args: Positional arguments of func.
+        **kwargs: Keyword arguments of func.
+
+    Returns:
+        Future: The pending result.
+    """
+    with _lock:
+        future = _in_flight.get(key)
+        if future is not None:
+            return future
+        future = _executor.submit(func, *args, **kwargs)
+        _in_flight[key] = future
+    future.add_done_callback(lambda done: _forget(key, done))
+    return future
+
+
+def fetch(
+    key: Hashable,
+    func: Callable,
+    *args,
+    timeout: float = FETCH_TIMEOUT_S,
+    **kwargs,
+) -> object:
+    """
+    Run a slow call through the fetch pool and wait for its result.
+
+    A call that times out keeps running in its worker, so a later fetch with the
+    same key picks it up instead of starting over.
+
+    Args:
+        key (Hashable): Identifies the call, equal keys must mean equal results.
+        func (Callable): The function to run.
+        *args: Positional arguments of func.
+        timeout (float, optional): Seconds to wait. Defaults to 90.
+        **kwargs: Keyword arguments of func.
+
+    Returns:
+        object: The return value of func.
+
+    Raises:
+        concurrent.futures.TimeoutError: If the call does not finish in time,
+            the built-in TimeoutError only from Python 3.11.
+    """
+    return submit(key, func, *args, **kwargs).result(timeout=timeout)
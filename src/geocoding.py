@@ -0,0 +1,58 @@
+import os
+import sys
+import osmnx as ox
+from geopandas import GeoDataFrame
+
+# place names and boundaries rarely change, so they are kept much longer than POIs
+GEOCODE_CACHE_TTL_S = 90 * 24 * 60 * 60
+GEOCODE_CACHE_MAX_ENTRIES = 10_000
+
+if os.getcwd().endswith("notebooks") or os.getcwd().endswith("src"):
+    os.chdir("..")
+
+if "src" not in sys.path:
+    sys.path.append("src")
+
+from persistent_cache import normalise_text, persistent_cache
+
+
+def _place_key(placename: str) -> str:
+    return normalise_text(placename)
+
+
+@persistent_cache(
+    "geocode_point",
+    key=_place_key,
+    ttl_s=GEOCODE_CACHE_TTL_S,
+    max_entries=GEOCODE_CACHE_MAX_ENTRIES,
+)
+def geocode(placename: str) -> tuple[float, float]:
+    """
+    Geocode a place name to a point, through the shared persistent cache.
+
+    Args:
+        placename (str): Name of the place.
+
+    Returns:
+        tuple[float, float]: (lat, lon) of the place, as ox.geocode returns it.
+    """
+    return ox.geocode(placename)
+
+
+@persistent_cache(
+    "geocode_boundary",
+    key=_place_key,
+    ttl_s=GEOCODE_CACHE_TTL_S,
+    max_entries=GEOCODE_CACHE_MAX_ENTRIES,
+)
+def geocode_to_gdf(placename: str) -> GeoDataFrame:
+    """
+    Geocode a place name to its boundary, through the shared persistent cache.
+
+    Args:
+        placename (str): Name of the place.
+
+    Returns:
+        GeoDataFrame: The boundary of the place, as ox.geocode_to_gdf returns it.
+    """
+    return ox.geocode_to_gdf(placename)
@@ -0,0 +1,494 @@
+import os
+import sys
+import math
+from warnings import warn
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+import igraph as ig
+from geopandas import GeoDataFrame
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+# relative padding of the search bounds in nearest_other_sources
+BOUND_SLACK = 1e-9
+
+PAGERANK_ALPHA = 0.85
+# stop when the L1 change of the scores drops below n * tol, as nx.pagerank does
+PAGERANK_TOL = 1e-6
+PAGERANK_MAX_ITER = 100
+# floor on edge travel times when weighting PageRank by their inverse
+MIN_TRAVEL_TIME_S = 0.1
+
+# defaults for sampled betweenness, see approximate_betweenness
+BETWEENNESS_SAMPLES = 500
+BETWEENNESS_DELTA = 0.1
+BETWEENNESS_SEED = 0
+BETWEENNESS_BATCHES = 10
+# 1 runs betweenness in this process, more uses a pool of worker processes
+BETWEENNESS_WORKERS = int(os.environ.get("BETWEENNESS_WORKERS", 1))
+# source chunks per worker, so a slow chunk does not leave cores idle
+BETWEENNESS_CHUNKS_PER_WORKER = 4
+
+if os.getcwd().endswith("notebooks") or os.getcwd().endswith("src"):
+    os.chdir("..")
+
+if "src" not in sys.path:
+    sys.path.append("src")
+
+
+class CompactGraph(NamedTuple):
+    """
+    Array-backed street graph shared by every graph metric.
+
+    Node i is nodes[i], edge j runs from sources[j] to targets[j] and is row j of
+    the edge table the graph was built from, so metric results line up with the
+    node and edge GeoDataFrames by position.
+    """
+
+    nodes: pd.Index
+    sources: np.ndarray
+    targets: np.ndarray
+    travel_time: np.ndarray
+    directed: bool = True
+
+
+def compact_graph(
+    nodes: GeoDataFrame, edges: GeoDataFrame, directed: bool = True
+) -> CompactGraph:
+    """
+    Build the compact graph of a street network from its osmnx GeoDataFrames.
+
+    Args:
+        nodes (GeoDataFrame): Nodes indexed by osmid, as from ox.graph_to_gdfs.
+        edges (GeoDataFrame): Edges indexed by (u, v, key) with a travel_time column.
+        directed (bool, optional): Whether edges are one-way. Defaults to True.
+
+    Returns:
+        CompactGraph: The graph in node and edge table order.
+    """
+    index = pd.Index(nodes.index)
+    sources = index.get_indexer(edges.index.get_level_values("u"))
+    targets = index.get_indexer(edges.index.get_level_values("v"))
+    if (sources < 0).any() or (targets < 0).any():
+        raise ValueError("Edges refer to nodes missing from the node table")
+    return CompactGraph(
+        nodes=index,
+        sources=sources.astype(np.int32),
+        targets=targets.astype(np.int32),
+        travel_time=edges["travel_time"].to_numpy(dtype=float),
+        directed=directed,
+    )
+
+
+def to_igraph(graph: CompactGraph) -> ig.Graph:
+    """
+    The igraph view of a compact graph, with travel_time as the only attribute.
+
+    Vertex and edge ids are the compact graph's positions, so igraph results need
+    no remapping.
+    """
+    ig_graph = ig.Graph(
+        n=len(graph.nodes),
+        edges=np.column_stack((graph.sources, graph.targets)),
+        directed=graph.directed,
+    )
+    ig_graph.es["travel_time"] = graph.travel_time
+    return ig_graph
+
+
+def weight_matrix(graph: CompactGraph) -> csr_matrix:
+    """
+    Convert a compact graph into a sparse adjacency matrix of travel times.
+
+    Parallel edges are reduced to the lightest one, which is the only one a
+    shortest path can use. Undirected graphs get an entry in both directions.
+
+    Args:
+        graph (CompactGraph): The street network.
+
+    Returns:
+        csr_matrix: |V| x |V| matrix of travel times, in node order.
+    """
+    sources, targets = graph.sources, graph.targets
+    weights = graph.travel_time
+    if not graph.directed:
+        sources, targets = np.r_[sources, targets], np.r_[targets, sources]
+        weights = np.r_[weights, weights]
+
+    order = np.lexsort((weights, targets, sources))
+    sources, targets, weights = sources[order], targets[order], weights[order]
+    lightest = np.ones(len(order), dtype=bool)
+    lightest[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+    n = len(graph.nodes)
+    return csr_matrix(
+        (weights[lightest], (sources[lightest], targets[lightest])), shape=(n, n)
+    )
+
+
+def edge_average(graph: CompactGraph, values: np.ndarray) -> np.ndarray:
+    """
+    Blend a node value onto the edges as the mean of both endpoints.
+
+    Args:
+        graph (CompactGraph): The street network.
+        values (np.ndarray): One value per node, in node order.
+
+    Returns:
+        np.ndarray: One value per edge, in edge order.
+    """
+    values = np.asarray(values, dtype=float)
+    return (values[graph.sources] + values[graph.targets]) / 2
+
+
+def nearest_sources(
+    adjacency: csr_matrix, sources: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Distance from every node to its nearest source, and which source that is.
+
+    One multi-source Dijkstra on the transposed graph, so one-way streets are
+    followed towards the sources. Each source is its own nearest, at distance 0.
+
+    Args:
+        adjacency (csr_matrix): Edge weights, from weight_matrix.
+        sources (np.ndarray): Matrix indices of the source nodes.
+
+    Returns:
+        tuple: (distances, source indices) per node. Nodes that reach no source
+            have distance inf and source -1.
+    """
+    distances, _, labels = dijkstra(
+        adjacency.T.tocsr(),
+        indices=sources,
+        min_only=True,
+        return_predecessors=True,
+    )
+    return distances, np.where(labels < 0, -1, labels).astype(np.int64)
+
+
+def nearest_other_sources(
+    adjacency: csr_matrix, sources: np.ndarray
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Distance from every source to the nearest other source, and which one it is.
+
+    Multi-source searches from and to the sources give every source an upper
+    bound: the shortest route that leaves the area it reaches first and enters
+    the area of another source. Each source then gets its own Dijkstra cut off at
+    that bound, which is usually tight, so the searches stay local.
+
+    Args:
+        adjacency (csr_matrix): Edge weights, from weight_matrix.
+        sources (np.ndarray): Matrix indices of the source nodes.
+
+    Returns:
+        tuple: (distances, source indices), one per source in the given order.
+            Sources that reach no other source have distance inf and source -1.
+    """
+    sources = np.asarray(sources)
+    distances = np.full(len(sources), np.inf)
+    labels = np.full(len(sources), -1, dtype=np.int64)
+    if len(sources) < 2:
+        return distances, labels
+
+    from_sources, _, from_labels = dijkstra(
+        adjacency, indices=sources, min_only=True, return_predecessors=True
+    )
+    to_sources, to_labels = nearest_sources(adjacency, sources)
+    edges = adjacency.tocoo()
+    u, v = edges.row, edges.col
+    crossing = (from_labels[u] >= 0) & (to_labels[v] >= 0)
+    crossing &= from_labels[u] != to_labels[v]
+    bounds = np.full(adjacency.shape[0], np.inf)
+    np.minimum.at(
+        bounds,
+        from_labels[u][crossing],
+        (from_sources[u] + edges.data + to_sources[v])[crossing],
+    )
+
+    is_source = np.zeros(adjacency.shape[0], dtype=bool)
+    is_source[sources] = True
+    # the bounds add the weights in another order than Dijkstra, pad them so
+    # rounding never cuts off the path they stand for
+    limits = bounds * (1 + BOUND_SLACK)
+    for i, source in enumerate(sources):
+        from_source = dijkstra(adjacency, indices=source, limit=limits[source])
+        found = np.flatnonzero(is_source & np.isfinite(from_source))
+        found = found[found != source]
+        if not len(found) and np.isfinite(limits[source]):
+            # a finite bound is a real route to another store, never give up on it
+            from_source = dijkstra(adjacency, indices=source)
+            found = np.flatnonzero(is_source & np.isfinite(from_source))
+            found = found[found != source]
+        if len(found):
+            labels[i] = found[np.argmin(from_source[found])]
+            distances[i] = from_source[labels[i]]
+    return distances, labels
+
+
+def transition_matrix(graph: CompactGraph, weighted: bool = False) -> csr_matrix:
+    """
+    Transposed random-walk transition matrix of a compact graph.
+
+    Parallel edges add up, as nx.pagerank treats a multigraph. Weighted walks
+    prefer quick streets, each edge counting as the inverse of its travel time.
+
+    Args:
+        graph (CompactGraph): The street network.
+        weighted (bool, optional): Weight edges by inverse travel time.
+
+    Returns:
+        csr_matrix: |V| x |V| matrix whose column i holds the probabilities of
+            stepping from node i, all zero for nodes without out-edges.
+    """
+    sources, targets = graph.sources, graph.targets
+    if weighted:
+        weights = 1 / np.maximum(graph.travel_time, MIN_TRAVEL_TIME_S)
+    else:
+        weights = np.ones(len(sources))
+    if not graph.directed:
+        sources, targets = np.r_[sources, targets], np.r_[targets, sources]
+        weights = np.r_[weights, weights]
+
+    n = len(graph.nodes)
+    out_weight = np.bincount(sources, weights=weights, minlength=n)
+    return csr_matrix((weights / out_weight[sources], (targets, sources)), shape=(n, n))
+
+
+def pagerank(
+    graph: CompactGraph,
+    alpha: float = PAGERANK_ALPHA,
+    weighted: bool = False,
+    nstart: np.ndarray | None = None,
+    tol: float = PAGERANK_TOL,
+    max_iter: int = PAGERANK_MAX_ITER,
+) -> tuple[np.ndarray, int]:
+    """
+    PageRank by power iteration on the sparse transition matrix.
+
+    Unweighted, it is the PageRank of nx.pagerank: uniform teleport and dangling
+    nodes spreading their rank uniformly. Starting from the scores of a similar
+    graph or earlier parameters, it converges in a few iterations.
+
+    Args:
+        graph (CompactGraph): The street network.
+        alpha (float, optional): Damping factor. Defaults to 0.85.
+        weighted (bool, optional): Weight edges by inverse travel time.
+        nstart (np.ndarray, optional): Starting scores in node order, normalised
+            to sum to 1. Defaults to uniform.
+        tol (float, optional): Per-node convergence threshold; iteration stops
+            when the L1 change of the scores is below n * tol. Defaults to 1e-6.
+        max_iter (int, optional): Iterations before giving up with a warning and
+            the latest scores. Defaults to 100.
+
+    Returns:
+        tuple: (scores summing to 1 in node order, iterations used).
+    """
+    n = len(graph.nodes)
+    if n == 0:
+        return np.zeros(0), 0
+    transition = transition_matrix(graph, weighted)
+    dangling = np.asarray(transition.sum(axis=0)).ravel() == 0
+
+    if nstart is None:
+        scores = np.full(n, 1 / n)
+    else:
+        scores = np.asarray(nstart, dtype=float)
+        scores = scores / scores.sum()
+
+    for iteration in range(1, max_iter + 1):
+        previous = scores
+        scores = alpha * (transition @ previous + previous[dangling].sum() / n)
+        scores += (1 - alpha) / n
+        if np.abs(scores - previous).sum() < n * tol:
+            return scores, iteration
+    warn(f"PageRank did not converge in {max_iter} iterations")
+    return scores, max_iter
+
+
+def betweenness_sample_size(
+    n: int, epsilon: float, delta: float = BETWEENNESS_DELTA
+) -> int:
+    """
+    Number of sampled sources that bounds the betweenness error of every node.
+
+    Each source adds at most n - 2 to a node's betweenness, so by Hoeffding's
+    inequality and a union bound over the nodes, with probability 1 - delta no
+    node's estimate is off by more than epsilon * n * (n - 1), i.e. epsilon on
+    the normalised [0, 1] betweenness scale.
+
+    Args:
+        n (int): Number of nodes.
+        epsilon (float): Largest error on the normalised scale.
+        delta (float, optional): Probability of exceeding it. Defaults to 0.1.
+
+    Returns:
+        int: Sources to sample, at most n.
+    """
+    return min(n, math.ceil(math.log(2 * n / delta) / (2 * epsilon**2)))
+
+
+def approximate_betweenness(
+    graph: CompactGraph,
+    k: int | None = BETWEENNESS_SAMPLES,
+    epsilon: float | None = None,
+    delta: float = BETWEENNESS_DELTA,
+    seed: int = BETWEENNESS_SEED,
+    batches: int = BETWEENNESS_BATCHES,
+    workers: int = BETWEENNESS_WORKERS,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Travel-time betweenness estimated from the shortest paths of sampled sources.
+
+    The dependencies of k sources drawn without replacement are scaled by n / k,
+    an unbiased estimate on the same scale as igraph's exact betweenness. The
+    sources are processed in batches and the spread of the batch estimates
+    gives a standard error for every node. With k >= n the result is exact.
+
+    Args:
+        graph (CompactGraph): The street network.
+        k (int, optional): Sources to sample. Defaults to 500. None computes the
+            exact betweenness unless epsilon is given.
+        epsilon (float, optional): Target error on the normalised scale, see
+            betweenness_sample_size. Overrides k when given.
+        delta (float, optional): Probability of missing epsilon. Defaults to 0.1.
+        seed (int, optional): Seed of the source sample. Defaults to 0.
+        batches (int, optional): Batches used to estimate the error. Defaults to 10.
+        workers (int, optional): Processes to spread the sources over, see
+            source_betweenness. The result does not depend on it. Defaults to 1.
+
+    Returns:
+        tuple: (betweenness, standard error), one value per node in node order.
+    """
+    n = len(graph.nodes)
+    if epsilon is not None:
+        k = betweenness_sample_size(n, epsilon, delta)
+    if k is None or k >= n:
+        if workers > 1:
+            exact = source_betweenness(graph, [np.arange(n)], workers)[0]
+        else:
+            exact = np.array(to_igraph(graph).betweenness(weights="travel_time"))
+        return exact, np.zeros(n)
+
+    sources = np.random.default_rng(seed).choice(n, size=k, replace=False)
+    batch_sources = np.array_split(sources, min(batches, k))
+    batch_sums = source_betweenness(graph, batch_sources, workers)
+    estimate = batch_sums.sum(axis=0) * n / k
+
+    if len(batch_sources) < 2:
+        return estimate, np.full(n, np.nan)
+    batch_sizes = np.array([len(batch) for batch in batch_sources])
+    batch_estimates = batch_sums * n / batch_sizes[:, None]
+    finite_population = math.sqrt((n - k) / (n - 1))
+    standard_error = (
+        batch_estimates.std(axis=0, ddof=1)
+        / math.sqrt(len(batch_sources))
+        * finite_population
+    )
+    return estimate, standard_error
+
+
+def _share_array(array: np.ndarray) -> tuple[SharedMemory, tuple]:
+    """
+    Copy an array into a new shared memory block.
+
+    Returns:
+        tuple: (the block, which the caller must unlink, and the (name, shape,
+            dtype) a worker needs to attach to it).
+    """
+    block = SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+# the graph of a betweenness worker process, attached once by its initializer
+_WORKER_GRAPH = None
+_WORKER_BLOCKS = []
+
+
+def _init_betweenness_worker(n: int, directed: bool, shared: list[tuple]) -> None:
+    """
+    Attach a worker to the shared edge arrays and build its igraph view once.
+    """
+    global _WORKER_GRAPH
+    arrays = []
+    for name, shape, dtype in shared:
+        block = SharedMemory(name=name)
+        _WORKER_BLOCKS.append(block)
+        arrays.append(np.ndarray(shape, dtype=dtype, buffer=block.buf))
+    sources, targets, travel_time = arrays
+    _WORKER_GRAPH = to_igraph(
+        CompactGraph(pd.RangeIndex(n), sources, targets, travel_time, directed)
+    )
+
+
+def _worker_betweenness(sources: np.ndarray) -> np.ndarray:
+    return np.array(
+        _WORKER_GRAPH.betweenness(weights="travel_time", sources=sources.tolist())
+    )
+
+
+def source_betweenness(
+    graph: CompactGraph,
+    source_batches: list[np.ndarray],
+    workers: int = BETWEENNESS_WORKERS,
+) -> np.ndarray:
+    """
+    Betweenness from the shortest paths of each batch of sources.
+
+    Betweenness is a sum over sources, so batches are split into chunks that
+    run on a pool of worker processes and the partial sums are added back up.
+    The workers read the edge arrays from shared memory rather than receiving a
+    pickled copy of the graph.
+
+    Args:
+        graph (CompactGraph): The street network.
+        source_batches (list[np.ndarray]): Node indices of the sources, per batch.
+        workers (int, optional): Processes to use, 1 runs in this process.
+
+    Returns:
+        np.ndarray: batches x |V| betweenness sums, in node order.
+    """
+    n = len(graph.nodes)
+    if workers <= 1:
+        ig_graph = to_igraph(graph)
+        return np.array(
+            [
+                ig_graph.betweenness(weights="travel_time", sources=batch.tolist())
+                for batch in source_batches
+            ]
+        ).reshape(len(source_batches), n)
+
+    splits = math.ceil(workers * BETWEENNESS_CHUNKS_PER_WORKER / len(source_batches))
+    chunks, owners = [], []
+    for i, batch in enumerate(source_batches):
+        for chunk in np.array_split(batch, min(splits, max(len(batch), 1))):
+            chunks.append(chunk)
+            owners.append(i)
+
+    blocks, shared = [], []
+    try:
+        for array in (graph.sources, graph.targets, graph.travel_time):
+            block, descriptor = _share_array(np.ascontiguousarray(array))
+            blocks.append(block)
+            shared.append(descriptor)
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(chunks)),
+            mp_context=get_context("spawn"),
+            initializer=_init_betweenness_worker,
+            initargs=(n, graph.directed, shared),
+        ) as executor:
+            batch_sums = np.zeros((len(source_batches), n))
+            for owner, partial in zip(
+                owners, executor.map(_worker_betweenness, chunks)
+            ):
+                batch_sums[owner] += partial
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return batch_sums
@@ -0,0 +1,382 @@
+import os
+import re
+import sys
+from functools import cache
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import networkx as nx
+import osmnx as ox
+import shapely
+import geopandas as gpd
+from geopandas import GeoDataFrame
+from osmnx._errors import InsufficientResponseError
+from shapely import STRtree
+from shapely.geometry.base import BaseGeometry
+
+GEODESIC_EPSG = 4326
+# "overpass" queries the public API, "extract" answers from an ingested .osm.pbf file
+OSM_BACKEND = os.environ.get("OSM_BACKEND", "overpass")
+OSM_STORE_DIR = Path(os.environ.get("OSM_STORE_DIR", Path("data", "processed", "osm")))
+# only features carrying one of these keys are kept as POIs
+POI_KEYS = ("shop", "amenity")
+ROAD_TAG_KEYS = sorted(set(ox.settings.useful_tags_way) | {"motor_vehicle", "motorcar"})
+# the buffer graph_from_polygon downloads around the polygon to clean the periphery
+PERIPHERY_BUFFER_M = 500
+
+if os.getcwd().endswith("notebooks") or os.getcwd().endswith("src"):
+    os.chdir("..")
+
+if "src" not in sys.path:
+    sys.path.append("src")
+
+from geocoding import geocode_to_gdf
+
+_FILTER_PATTERN = re.compile(r'\["([^"]+)"(?:(!?[~=])"([^"]*)")?\]')
+
+
+def _store_paths(store_dir: Path) -> dict[str, Path]:
+    return {
+        "pois": Path(store_dir, "pois.parquet"),
+        "nodes": Path(store_dir, "road_nodes.parquet"),
+        "ways": Path(store_dir, "road_ways.parquet"),
+    }
+
+
+def ingest_extract(pbf_path: Path, store_dir: Path = OSM_STORE_DIR) -> None:
+    """
+    Read a regional .osm.pbf extract once into indexed GeoParquet stores.
+
+    POIs (nodes, ways and multipolygons tagged with one of POI_KEYS) are stored
+    with their geometry and every tag. Highway ways are stored with their node
+    references and bounding box, and their nodes with coordinates, so road
+    graphs can be assembled without network access. Requires pyosmium.
+
+    Args:
+        pbf_path (Path): The .osm.pbf (or .osm) extract, e.g. from Geofabrik.
+        store_dir (Path, optional): Destination directory of the stores.
+    """
+    try:
+        import osmium
+    except ImportError as e:
+        raise ImportError(
+            "Ingesting an OSM extract requires pyosmium: pip install osmium"
+        ) from e
+
+    class ExtractHandler(osmium.SimpleHandler):
+        def __init__(self):
+            super().__init__()
+            self.wkb = osmium.geom.WKBFactory()
+            self.pois = []
+            self.ways = []
+            self.nodes = {}
+            self.node_tags = {}
+
+        def _add_poi(self, element_type, osmid, tags, wkb):
+            self.pois.append(
+                {"element_type": element_type, "osmid": osmid, "geometry": wkb, **tags}
+            )
+
+        def node(self, n):
+            tags = {tag.k: tag.v for tag in n.tags}
+            if any(key in tags for key in POI_KEYS):
+                self._add_poi("node", n.id, tags, self.wkb.create_point(n))
+            useful = {
+                key: tags[key] for key in ox.settings.useful_tags_node if key in tags
+            }
+            if useful:
+                self.node_tags[n.id] = useful
+
+        def way(self, w):
+            tags = {tag.k: tag.v for tag in w.tags}
+            # closed POI ways arrive through area() as polygons
+            if any(key in tags for key in POI_KEYS) and not w.is_closed():
+                self._add_poi("way", w.id, tags, self.wkb.create_linestring(w))
+            if "highway" not in tags:
+                return
+            refs, lons, lats = [], [], []
+            for node in w.nodes:
+                if not node.location.valid():
+                    continue
+                refs.append(node.ref)
+                lons.append(node.location.lon)
+                lats.append(node.location.lat)
+                self.nodes[node.ref] = (node.location.lat, node.location.lon)
+            if len(refs) < 2:
+                return
+            self.ways.append(
+                {
+                    "osmid": w.id,
+                    "nodes": refs,
+                    "minx": min(lons),
+                    "miny": min(lats),
+                    "maxx": max(lons),
+                    "maxy": max(lats),
+                    **{key: tags[key] for key in ROAD_TAG_KEYS if key in tags},
+                }
+            )
+
+        def area(self, a):
+            tags = {tag.k: tag.v for tag in a.tags}
+            if any(key in tags for key in POI_KEYS):
+                element_type = "way" if a.from_way() else "relation"
+                self._add_poi(
+                    element_type, a.orig_id(), tags, self.wkb.create_multipolygon(a)
+                )
+
+    handler = ExtractHandler()
+    handler.apply_file(str(pbf_path), locations=True)
+    paths = _store_paths(store_dir)
+    Path(store_dir).mkdir(parents=True, exist_ok=True)
+
+    pois = pd.DataFrame(handler.pois)
+    if pois.empty:
+        # an extract without POIs still gets a POI layer, an empty one
+        pois = pd.DataFrame(columns=["element_type", "osmid", "geometry"])
+    geometry = shapely.from_wkb(pois.pop("geometry").to_numpy())
+    # single part areas come back as polygons, as they do from Overpass
+    single = shapely.get_num_geometries(geometry) == 1
+    geometry[single] = shapely.get_geometry(geometry[single], 0)
+    GeoDataFrame(pois, geometry=geometry, crs=f"EPSG:{GEODESIC_EPSG}").to_parquet(
+        paths["pois"], index=False
+    )
+
+    nodes = pd.DataFrame(
+        [(osmid, lat, lon) for osmid, (lat, lon) in handler.nodes.items()],
+        columns=["osmid", "lat", "lon"],
+    )
+    node_tags = pd.DataFrame.from_dict(handler.node_tags, orient="index")
+    nodes = nodes.join(node_tags, on="osmid")
+    nodes.to_parquet(paths["nodes"], index=False)
+    pd.DataFrame(handler.ways).to_parquet(paths["ways"], index=False)
+
+    _poi_index.cache_clear()
+    _road_store.cache_clear()
+
+
+def load_pois(store_dir: Path = OSM_STORE_DIR) -> GeoDataFrame:
+    """
+    Read every POI of the ingested extract.
+
+    Args:
+        store_dir (Path, optional): Directory of the ingested stores.
+
+    Returns:
+        GeoDataFrame: The POIs with their tags, in longitude and latitude.
+    """
+    path = _store_paths(store_dir)["pois"]
+    if not path.exists():
+        raise FileNotFoundError(
+            f"No OSM extract in {store_dir}, run ingest_extract on a .osm.pbf file first"
+        )
+    return gpd.read_parquet(path)
+
+
+@cache
+def _poi_index(store_dir: Path = OSM_STORE_DIR) -> tuple[GeoDataFrame, STRtree]:
+    """
+    Load the POI store and its spatial index once per process.
+    """
+    pois = load_pois(store_dir)
+    return pois, STRtree(pois.geometry.values)
+
+
+@cache
+def _road_store(store_dir: Path = OSM_STORE_DIR) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Load the road node and way stores once per process.
+    """
+    paths = _store_paths(store_dir)
+    if not paths["ways"].exists():
+        raise FileNotFoundError(
+            f"No OSM extract in {store_dir}, run ingest_extract on a .osm.pbf file first"
+        )
+    return pd.read_parquet(paths["nodes"]), pd.read_parquet(paths["ways"])
+
+
+def _tags_mask(features: pd.DataFrame, tags: dict) -> np.ndarray:
+    """
+    Flag the features matching any of the tags, with the semantics of osmnx.features.
+
+    A value of True matches any value of the key, a string matches exactly and a
+    list matches any of its items.
+    """
+    mask = np.zeros(len(features), dtype=bool)
+    for key, value in tags.items():
+        if key not in POI_KEYS:
+            raise ValueError(f"The OSM extract only stores POIs keyed by {POI_KEYS}")
+        if key not in features.columns:
+            continue
+        if value is True:
+            mask |= features[key].notna().to_numpy()
+        elif isinstance(value, list):
+            mask |= features[key].isin(value).to_numpy()
+        else:
+            mask |= (features[key] == value).to_numpy()
+    return mask
+
+
+def features_from_polygon(
+    polygon: BaseGeometry, tags: dict, store_dir: Path = OSM_STORE_DIR
+) -> GeoDataFrame:
+    """
+    Offline equivalent of ox.features_from_polygon, answered from the ingested extract.
+
+    Args:
+        polygon (BaseGeometry): Area to search, in longitude and latitude.
+        tags (dict): Tags to match, as accepted by osmnx.
+        store_dir (Path, optional): Directory of the ingested stores.
+
+    Returns:
+        GeoDataFrame: Matching features indexed by (element_type, osmid).
+
+    Raises:
+        InsufficientResponseError: If no feature matches, like osmnx.
+    """
+    pois, tree = _poi_index(store_dir)
+    hits = np.sort(tree.query(polygon, predicate="intersects"))
+    features = pois.iloc[hits]
+    features = features[_tags_mask(features, tags)].dropna(axis=1, how="all")
+    if features.empty:
+        raise InsufficientResponseError(
+            "No matching features in the OSM extract. Check query location and tags."
+        )
+    return features.set_index(["element_type", "osmid"])
+
+
+def features_from_place(
+    placename: str, tags: dict, store_dir: Path = OSM_STORE_DIR
+) -> GeoDataFrame:
+    """
+    Offline equivalent of ox.features_from_place. Only resolving the place boundary
+    needs the geocoder, and only the first time a place is seen.
+
+    Args:
+        placename (str): Name of the place.
+        tags (dict): Tags to match, as accepted by osmnx.
+        store_dir (Path, optional): Directory of the ingested stores.
+
+    Returns:
+        GeoDataFrame: Matching features indexed by (element_type, osmid).
+    """
+    polygon = geocode_to_gdf(placename)["geometry"].unary_union
+    return features_from_polygon(polygon, tags, store_dir)
+
+
+def _filter_mask(ways: pd.DataFrame, custom_filter: str) -> np.ndarray:
+    """
+    Evaluate an Overpass tag filter such as '["highway"~"primary|secondary"]' on the ways.
+
+    Supports the [key], [key=value], [key!=value], [key~regex] and [key!~regex] forms.
+    """
+    clauses = _FILTER_PATTERN.findall(custom_filter)
+    if not clauses or _FILTER_PATTERN.sub("", custom_filter).strip():
+        raise ValueError(f"Unsupported custom filter {custom_filter}")
+
+    mask = np.ones(len(ways), dtype=bool)
+    for key, operator, pattern in clauses:
+        if key not in ROAD_TAG_KEYS:
+            raise ValueError(f"The OSM extract does not store the way tag {key}")
+        if key not in ways.columns:
+            values = pd.Series(None, index=ways.index, dtype=object)
+        else:
+            values = ways[key]
+        if not operator:
+            mask &= values.notna().to_numpy()
+        elif operator == "=":
+            mask &= (values == pattern).to_numpy()
+        elif operator == "!=":
+            mask &= (values != pattern).to_numpy()
+        elif operator == "~":
+            mask &= values.str.contains(pattern, regex=True, na=False).to_numpy()
+        else:
+            mask &= ~values.str.contains(pattern, regex=True, na=False).to_numpy()
+    return mask
+
+
+def _network_elements(
+    polygon: BaseGeometry, custom_filter: str, store_dir: Path
+) -> dict:
+    """
+    Assemble the roads intersecting a polygon's bounding box as an Overpass response.
+    """
+    nodes, ways = _road_store(store_dir)
+    minx, miny, maxx, maxy = polygon.bounds
+    ways = ways[
+        (ways["maxx"] >= minx)
+        & (ways["minx"] <= maxx)
+        & (ways["maxy"] >= miny)
+        & (ways["miny"] <= maxy)
+    ]
+    ways = ways[_filter_mask(ways, custom_filter)]
+    if ways.empty:
+        return {"elements": []}
+
+    node_ids = np.unique(np.concatenate(ways["nodes"].to_numpy()))
+    nodes = nodes[nodes["osmid"].isin(node_ids)]
+    node_tag_keys = [key for key in ox.settings.useful_tags_node if key in nodes]
+    way_tag_keys = [key for key in ROAD_TAG_KEYS if key in ways]
+
+    elements = [
+        {
+            "type": "node",
+            "id": row["osmid"],
+            "lat": row["lat"],
+            "lon": row["lon"],
+            "tags": {key: row[key] for key in node_tag_keys if pd.notna(row[key])},
+        }
+        for row in nodes.to_dict(orient="records")
+    ]
+    elements += [
+        {
+            "type": "way",
+            "id": row["osmid"],
+            "nodes": list(row["nodes"]),
+            "tags": {key: row[key] for key in way_tag_keys if pd.notna(row[key])},
+        }
+        for row in ways.to_dict(orient="records")
+    ]
+    return {"elements": elements}
+
+
+def graph_from_polygon(
+    polygon: BaseGeometry,
+    custom_filter: str,
+    simplify: bool = True,
+    retain_all: bool = False,
+    store_dir: Path = OSM_STORE_DIR,
+) -> nx.MultiDiGraph:
+    """
+    Offline equivalent of ox.graph_from_polygon for one-way aware (drive) networks.
+
+    Mirrors osmnx: the roads are assembled within a 500 m buffer, truncated and
+    simplified, then truncated to the polygon with street counts from the buffer.
+
+    Args:
+        polygon (BaseGeometry): Area to build the network for, in longitude and latitude.
+        custom_filter (str): Overpass way filter, e.g. '["highway"~"primary|secondary"]'.
+        simplify (bool, optional): Whether to simplify the graph topology. Defaults to True.
+        retain_all (bool, optional): Keep disconnected components. Defaults to False.
+        store_dir (Path, optional): Directory of the ingested stores.
+
+    Returns:
+        nx.MultiDiGraph: The road network, in the format osmnx returns.
+    """
+    poly_proj, crs_utm = ox.projection.project_geometry(polygon)
+    poly_buff, _ = ox.projection.project_geometry(
+        poly_proj.buffer(PERIPHERY_BUFFER_M), crs=crs_utm, to_latlong=True
+    )
+    response = _network_elements(poly_buff, custom_filter, store_dir)
+    # the same graph builder osmnx applies to Overpass responses
+    G_buff = ox.graph._create_graph([response], retain_all=True, bidirectional=False)
+    G_buff = ox.truncate.truncate_graph_polygon(G_buff, poly_buff, True, False)
+    if simplify:
+        G_buff = ox.simplification.simplify_graph(G_buff)
+    G = ox.truncate.truncate_graph_polygon(G_buff, polygon, retain_all, False)
+    street_counts = ox.stats.count_streets_per_node(G_buff, nodes=G.nodes)
+    nx.set_node_attributes(G, values=street_counts, name="street_count")
+    return G
+
+
+if __name__ == "__main__":
+    ingest_extract(Path(sys.argv[1]))
@@ -0,0 +1,172 @@
+import os
+import sys
+import time
+import pickle
+import sqlite3
+import threading
+from functools import wraps
+from pathlib import Path
+from typing import Callable
+
+CACHE_PATH = Path("data", "processed", "cache", "persistent_cache.sqlite")
+DEFAULT_TTL_S = 7 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 2_000
+
+if os.getcwd().endswith("notebooks") or os.getcwd().endswith("src"):
+    os.chdir("..")
+
+if "src" not in sys.path:
+    sys.path.append("src")
+
+MISSING = object()
+_connections = threading.local()
+
+
+def normalise_text(text: str) -> str:
+    """
+    Normalise free text such as a place name for use in a cache key.
+
+    "  Denver,CO " and "denver, co" map to the same key.
+    """
+    text = text.replace(",", ", ")
+    return " ".join(text.lower().split())
+
+
+def _connection(cache_path: Path = CACHE_PATH) -> sqlite3.Connection:
+    """
+    Open (once per thread) the SQLite database backing the cache.
+
+    WAL journaling lets every gunicorn worker read while another one writes.
+    """
+    connections = getattr(_connections, "by_path", None)
+    if connections is None:
+        connections = _connections.by_path = {}
+    if cache_path not in connections:
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(cache_path, timeout=30, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        connection.execute(
+            """CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                created REAL NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )"""
+        )
+        connection.execute(
+            "CREATE INDEX IF NOT EXISTS entries_lru ON entries (namespace, accessed)"
+        )
+        connections[cache_path] = connection
+    return connections[cache_path]
+
+
+def cache_get(
+    namespace: str,
+    key: str,
+    ttl_s: float = DEFAULT_TTL_S,
+    cache_path: Path = CACHE_PATH,
+) -> object:
+    """
+    Read an entry, refreshing its access time. Expired entries are removed.
+
+    Args:
+        namespace (str): Group of entries the key belongs to.
+        key (str): Cache key within the namespace.
+        ttl_s (float, optional): Maximum age of an entry in seconds. Defaults to a week.
+        cache_path (Path, optional): Location of the SQLite database.
+
+    Returns:
+        object: The cached value, or the MISSING sentinel on a miss.
+    """
+    connection = _connection(cache_path)
+    row = connection.execute(
+        "SELECT value, created FROM entries WHERE namespace = ? AND key = ?",
+        (namespace, key),
+    ).fetchone()
+    if row is None:
+        return MISSING
+
+    value, created = row
+    now = time.time()
+    if now - created > ttl_s:
+        connection.execute(
+            "DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+        )
+        return MISSING
+    connection.execute(
+        "UPDATE entries SET accessed = ? WHERE namespace = ? AND key = ?",
+        (now, namespace, key),
+    )
+    return pickle.loads(value)
+
+
+def cache_set(
+    namespace: str,
+    key: str,
+    value: object,
+    max_entries: int = DEFAULT_MAX_ENTRIES,
+    cache_path: Path = CACHE_PATH,
+) -> None:
+    """
+    Store an entry, evicting the least recently used ones beyond max_entries.
+
+    Args:
+        namespace (str): Group of entries the key belongs to.
+        key (str): Cache key within the namespace.
+        value (object): Any picklable value.
+        max_entries (int, optional): Size bound of the namespace. Defaults to 2,000.
+        cache_path (Path, optional): Location of the SQLite database.
+    """
+    connection = _connection(cache_path)
+    now = time.time()
+    connection.execute(
+        "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+        (namespace, key, pickle.dumps(value), now, now),
+    )
+    connection.execute(
+        """DELETE FROM entries WHERE namespace = ? AND key IN (
+            SELECT key FROM entries WHERE namespace = ?
+            ORDER BY accessed DESC LIMIT -1 OFFSET ?
+        )""",
+        (namespace, namespace, max_entries),
+    )
+
+
+def persistent_cache(
+    namespace: str,
+    key: Callable[..., str],
+    ttl_s: float = DEFAULT_TTL_S,
+    max_entries: int = DEFAULT_MAX_ENTRIES,
+    cache_path: Path = CACHE_PATH,
+) -> Callable:
+    """
+    Decorator caching a function's results in SQLite, shared across processes.
+
+    Args:
+        namespace (str): Group name of the entries, usually the function's purpose.
+        key (Callable): Builds the cache key from the function's arguments.
+        ttl_s (float, optional): Maximum age of an entry in seconds. Defaults to a week.
+        max_entries (int, optional): Size bound of the namespace, least recently
+            used entries are evicted first. Defaults to 2,000.
+        cache_path (Path, optional): Location of the SQLite database.
+
+    Returns:
+        Callable: The decorator.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            cache_key = key(*args, **kwargs)
+            result = cache_get(namespace, cache_key, ttl_s, cache_path)
+            if result is MISSING:
+                result = func(*args, **kwargs)
+                cache_set(namespace, cache_key, result, max_entries, cache_path)
+            return result
+
+        return wrapper
+
+    return decorator
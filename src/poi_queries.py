@@ -1,4 +1,8 @@
 import osmnx as ox
+import numpy as np
+import pandas as pd
+import shapely
+from pyproj import Geod, Transformer
 import geopandas as gpd
 from functools import cache
 from shapely.geometry import Point
@@ -6,6 +10,10 @@ from geopandas import GeoDataFrame
 from shapely.geometry.base import BaseGeometry
 import os
 import sys
+from math import floor
+from pathlib import Path
+from osmnx._errors import InsufficientResponseError
+from shapely import STRtree
 
 ox.settings.requests_timeout = 60
 
@@ -17,15 +25,38 @@ TERTIARY = [
     {"shop": "variety_store"},
     {"amenity": "fuel"},
 ]
+# Every tier in one query, labelled locally afterwards
+FOOD_TIERS = {"Grocery": PRIMARY, "Convenience": SECONDARY, "Low Quality": TERTIARY}
+ALL_FOOD_TAGS = [PRIMARY, *SECONDARY, *TERTIARY]
 
 GEODESIC_EPSG = 4326
 CARTESIAN_EPSG = 32633
+# vertices of a circle, as many as a GeoPandas buffer with its default resolution
+CIRCLE_SEGMENTS = 64
+WGS84 = Geod(ellps="WGS84")
 if os.getcwd().endswith("notebooks") or os.getcwd().endswith("src"):
     os.chdir("..")
 
 if "src" not in sys.path:
     sys.path.append("src")
 
+from persistent_cache import (
+    MISSING,
+    cache_get,
+    cache_set,
+    normalise_text,
+    persistent_cache,
+)
+from geocoding import geocode, geocode_to_gdf
+import osm_extract
+import poi_snapshot
+
+POI_CACHE_TTL_S = 7 * 24 * 60 * 60
+POI_CACHE_MAX_ENTRIES = 2_000
+# Overpass results are also cached per cell of a fixed grid, about 5 km on a side
+POI_TILE_DEG = 0.05
+POI_TILE_CACHE_MAX_ENTRIES = 50_000
+
 
 def _make_hashable_tags_helper(tags: dict | list[dict]) -> frozenset:
     """
@@ -59,10 +90,41 @@ def _make_hashable_tags_helper(tags: dict | list[dict]) -> frozenset:
         raise ValueError("Tags must be a dictionary or a list of dictionaries.")
 
 
-# @cache
+def _tags_cache_key(hashable_tags: frozenset) -> str:
+    """
+    Render hashable tags in a stable order, frozenset iteration order varies between processes.
+    """
+    return repr(sorted(hashable_tags))
+
+
+# keys start with the backend, Overpass and the offline extract can disagree
+def _place_cache_key(placename: str, hashable_tags: frozenset) -> str:
+    return (
+        f"{osm_extract.OSM_BACKEND}|{normalise_text(placename)}"
+        f"|{_tags_cache_key(hashable_tags)}"
+    )
+
+
+def _point_cache_key(
+    lat: float, lon: float, radius_m: int, hashable_tags: frozenset
+) -> str:
+    # 5 decimals is about a metre, finer differences fetch the same POIs
+    return (
+        f"{osm_extract.OSM_BACKEND}|{lat:.5f},{lon:.5f},{radius_m}"
+        f"|{_tags_cache_key(hashable_tags)}"
+    )
+
+
+@persistent_cache(
+    "poi_place",
+    key=_place_cache_key,
+    ttl_s=POI_CACHE_TTL_S,
+    max_entries=POI_CACHE_MAX_ENTRIES,
+)
 def _from_place_name_helper(placename: str, hashable_tags: frozenset) -> GeoDataFrame:
     """
     Cached function to store POI results based on place name and hashable tags.
+    Results persist in the SQLite cache shared by all workers.
 
     Args:
         placename (str): Name of the place.
@@ -76,16 +138,24 @@ def _from_place_name_helper(placename: str, hashable_tags: frozenset) -> GeoData
         key: list(value) if isinstance(value, tuple) else value
         for key, value in tags.items()
     }
-    
-    return ox.features_from_place(placename, tags=tags)
+
+    # what ox.features_from_place does, with the boundary from the geocoding cache
+    polygon = geocode_to_gdf(placename)["geometry"].unary_union
+    return features_from_polygon(polygon, tags=tags)
 
 
-# @cache
+@persistent_cache(
+    "poi_point",
+    key=_point_cache_key,
+    ttl_s=POI_CACHE_TTL_S,
+    max_entries=POI_CACHE_MAX_ENTRIES,
+)
 def _from_point_helper(
     lat: float, lon: float, radius_m: int, hashable_tags: frozenset
 ) -> GeoDataFrame:
     """
     Cached function to retrieve OSM features within a circular area based on tags.
+    Results persist in the SQLite cache shared by all workers.
 
     Args:
         lat (float): Latitude of the center point.
@@ -102,13 +172,155 @@ def _from_point_helper(
         key: list(value) if isinstance(value, tuple) else value
         for key, value in tags.items()
     }
-    return ox.features_from_polygon(polygon, tags=tags)
+    return features_from_polygon(polygon, tags=tags)
+
+
+@cache
+def _local_equal_area(lat_0: int, lon_0: int) -> tuple[Transformer, Transformer]:
+    """
+    Transformers to and from a Lambert azimuthal equal-area projection centred on a
+    whole degree, built once per region and process.
+    """
+    laea_proj = f"+proj=laea +lat_0={lat_0} +lon_0={lon_0} +units=m +ellps=WGS84"
+    return (
+        Transformer.from_crs(GEODESIC_EPSG, laea_proj, always_xy=True),
+        Transformer.from_crs(laea_proj, GEODESIC_EPSG, always_xy=True),
+    )
+
+
+def _transform_coordinates(geometries: np.ndarray, transformer: Transformer):
+    return shapely.transform(
+        geometries,
+        lambda coords: np.column_stack(
+            transformer.transform(coords[:, 0], coords[:, 1])
+        ),
+    )
+
+
+def _point_features(
+    lat: float, lon: float, radius_m: int, hashable_tags: frozenset
+) -> GeoDataFrame:
+    """
+    Retrieve OSM features within a circular area from the configured point backend.
+
+    In snapshot mode the preloaded national snapshot answers without any network
+    access or cache lookup, otherwise the query goes through _from_point_helper.
+
+    Args:
+        lat (float): Latitude of the center point.
+        lon (float): Longitude of the center point.
+        radius_m (int): Radius in meters.
+        hashable_tags (frozenset): Hashable representation of tags.
+
+    Returns:
+        GeoDataFrame: GeoDataFrame containing the OSM features.
+    """
+    if poi_snapshot.POI_POINT_BACKEND == "snapshot":
+        return poi_snapshot.features_near_point(lat, lon, radius_m, hashable_tags)
+    return _from_point_helper(lat, lon, radius_m, hashable_tags)
+
+
+def _tile_box(tile: tuple[int, int]) -> BaseGeometry:
+    column, row = tile
+    return shapely.box(
+        column * POI_TILE_DEG,
+        row * POI_TILE_DEG,
+        (column + 1) * POI_TILE_DEG,
+        (row + 1) * POI_TILE_DEG,
+    )
+
+
+def _covering_tiles(polygon: BaseGeometry) -> list[tuple[int, int]]:
+    """
+    List the grid cells, as (column, row), that intersect a polygon.
+    """
+    minx, miny, maxx, maxy = polygon.bounds
+    tiles = [
+        (column, row)
+        for column in range(floor(minx / POI_TILE_DEG), floor(maxx / POI_TILE_DEG) + 1)
+        for row in range(floor(miny / POI_TILE_DEG), floor(maxy / POI_TILE_DEG) + 1)
+    ]
+    shapely.prepare(polygon)
+    boxes = np.array([_tile_box(tile) for tile in tiles])
+    return [tile for tile, hit in zip(tiles, shapely.intersects(polygon, boxes)) if hit]
+
+
+def _tiled_features_from_polygon(polygon: BaseGeometry, tags: dict) -> GeoDataFrame:
+    """
+    Retrieve OSM features within a polygon through the grid cell cache.
+
+    Only the cells missing from the cache are requested from Overpass, all of
+    them in a single query. Every cell keeps the features intersecting it, so
+    overlapping searches reuse each other's results.
+
+    Args:
+        polygon (BaseGeometry): Area to search, in longitude and latitude.
+        tags (dict): Tags to match, as accepted by osmnx.
+
+    Returns:
+        GeoDataFrame: The features intersecting the polygon, as osmnx returns them.
+    """
+    tags_key = _tags_cache_key(_make_hashable_tags_helper(tags))
+    cells = {}
+    missing = []
+    for tile in _covering_tiles(polygon):
+        key = f"{tile[0]},{tile[1]}|{tags_key}"
+        cells[tile] = cache_get("poi_tile", key, POI_CACHE_TTL_S)
+        if cells[tile] is MISSING:
+            missing.append(tile)
+
+    if missing:
+        area = shapely.union_all([_tile_box(tile) for tile in missing])
+        try:
+            fetched = ox.features_from_polygon(area, tags=tags)
+            tree = STRtree(fetched.geometry.values)
+        except InsufficientResponseError:
+            fetched = None
+        for tile in missing:
+            hits = []
+            if fetched is not None:
+                hits = tree.query(_tile_box(tile), predicate="intersects")
+            # empty cells are cached too, as None
+            cells[tile] = fetched.iloc[np.sort(hits)] if len(hits) else None
+            key = f"{tile[0]},{tile[1]}|{tags_key}"
+            cache_set("poi_tile", key, cells[tile], POI_TILE_CACHE_MAX_ENTRIES)
+
+    frames = [features for features in cells.values() if features is not None]
+    if frames:
+        features = pd.concat(frames)
+        features = features[~features.index.duplicated()]
+        features = features[features.intersects(polygon)]
+    if not frames or features.empty:
+        raise InsufficientResponseError("No matching features found in the polygon.")
+    return features.dropna(axis=1, how="all")
+
+
+def features_from_polygon(polygon: BaseGeometry, tags: dict) -> GeoDataFrame:
+    """
+    Retrieve OSM features within a polygon from the configured backend.
+
+    The offline extract is queried directly, Overpass through the grid cell cache.
+
+    Args:
+        polygon (BaseGeometry): Area to search, in longitude and latitude.
+        tags (dict): Tags to match, as accepted by osmnx.
+
+    Returns:
+        GeoDataFrame: The matching features indexed by (element_type, osmid).
+    """
+    if osm_extract.OSM_BACKEND == "extract":
+        return osm_extract.features_from_polygon(polygon, tags=tags)
+    return _tiled_features_from_polygon(polygon, tags)
 
 
 def get_centroids(gdf_polygons: GeoDataFrame) -> GeoDataFrame:
     """
     Calculate the centroids of the geometries in a GeoDataFrame.
 
+    Points are returned untouched. Every other geometry is projected in one pass
+    to an equal-area projection centred on the data, so the centroids are correct
+    anywhere on the globe.
+
     Args:
         gdf_polygons (GeoDataFrame): GeoDataFrame containing the geometries.
 
@@ -120,9 +332,26 @@ def get_centroids(gdf_polygons: GeoDataFrame) -> GeoDataFrame:
             "GeoDataFrame has no CRS. Please set the CRS before calculating centroids."
         )
     original_projection = gdf_polygons.crs
-    gdf_projected = gdf_polygons.to_crs(epsg=CARTESIAN_EPSG)
-    centroids = gdf_projected.centroid.to_crs(original_projection)
-    return centroids
+    geodesic = original_projection.equals(GEODESIC_EPSG)
+    geometries = gdf_polygons.geometry
+    if not geodesic:
+        geometries = geometries.to_crs(epsg=GEODESIC_EPSG)
+    geometries = geometries.values.copy()
+    to_centroid = shapely.get_type_id(geometries) != shapely.GeometryType.POINT
+    if to_centroid.any():
+        minx, miny, maxx, maxy = shapely.total_bounds(geometries[to_centroid])
+        forward, inverse = _local_equal_area(
+            round((miny + maxy) / 2), round((minx + maxx) / 2)
+        )
+        projected = _transform_coordinates(geometries[to_centroid], forward)
+        geometries[to_centroid] = _transform_coordinates(
+            shapely.centroid(projected), inverse
+        )
+
+    centroids = gpd.GeoSeries(
+        geometries, index=gdf_polygons.index, crs=f"EPSG:{GEODESIC_EPSG}"
+    )
+    return centroids if geodesic else centroids.to_crs(original_projection)
 
 
 def encircle_place(placename):
@@ -134,7 +363,7 @@ def encircle_place(placename):
     gdf_circle (GeoDataFrame): A GeoDataFrame containing the minimum bounding circle of the place.
     """
 
-    gdf_polygon = ox.geocode_to_gdf(placename)
+    gdf_polygon = geocode_to_gdf(placename)
     crs = gdf_polygon.crs
     gdf_circle = (
         gdf_polygon.geometry.to_crs(CARTESIAN_EPSG)
@@ -145,13 +374,51 @@ def encircle_place(placename):
     return gdf_circle
 
 
+def create_circular_polygons(
+    lats: np.ndarray, lons: np.ndarray, radii_m: np.ndarray | int = 10_000
+) -> np.ndarray:
+    """
+    Creates circular polygons around many points on the Earth's surface in one pass.
+
+    Every vertex is found by solving the direct geodesic problem on the WGS84
+    ellipsoid, which gives the same circle as buffering in an azimuthal
+    equidistant projection centred on each point, without building one
+    projection per centre.
+
+    Args:
+        lats (np.ndarray): Latitudes of the center points.
+        lons (np.ndarray): Longitudes of the center points.
+        radii_m (np.ndarray | int, optional): Radius of every circle, or one radius
+            for all of them, in meters. Defaults to 10_000.
+
+    Returns:
+        np.ndarray: Circular polygon geometries, one per center point.
+    """
+    lats, lons, radii_m = np.broadcast_arrays(
+        np.asarray(lats, dtype=float),
+        np.asarray(lons, dtype=float),
+        np.asarray(radii_m, dtype=float),
+    )
+    # clockwise from north like a buffer, the first vertex repeated to close the ring
+    azimuths = np.linspace(0, 360, CIRCLE_SEGMENTS + 1) % 360
+    shape = (lats.size, CIRCLE_SEGMENTS + 1)
+    ring_lons, ring_lats, _ = WGS84.fwd(
+        np.broadcast_to(lons.reshape(-1, 1), shape).ravel(),
+        np.broadcast_to(lats.reshape(-1, 1), shape).ravel(),
+        np.broadcast_to(azimuths, shape).ravel(),
+        np.broadcast_to(radii_m.reshape(-1, 1), shape).ravel(),
+    )
+    rings = np.stack([ring_lons, ring_lats], axis=-1).reshape(*shape, 2)
+    return shapely.polygons(rings)
+
+
 def create_circular_polygon(
     lat: float = None, lon: float = None, point: Point = None, radius_m: int = 10_000
 ) -> BaseGeometry:
     """
-    Creates a circular polygon around a given point on the Earth's surface using GeoPandas.
+    Creates a circular polygon around a given point on the Earth's surface.
     Note: This function does not execute a query. It utilizes geographic libraries for their
-    projection utilities.
+    projection utilities. Use create_circular_polygons for many points at once.
     Args:
         lat (float, optional): Latitude of the center point. Defaults to None.
         lon (float, optional): Longitude of the center point. Defaults to None.
@@ -168,12 +435,7 @@ def create_circular_polygon(
     else:
         raise ValueError("You must provide either lat/lon or a Point object.")
 
-    gdf = gpd.GeoDataFrame(index=[0], crs=f"EPSG:{GEODESIC_EPSG}", geometry=[point])
-    aeqd_proj = f"+proj=aeqd +lat_0={lat} +lon_0={lon} +units=m +ellps=WGS84"
-    gdf_projected = gdf.to_crs(aeqd_proj)
-    gdf_projected["geometry"] = gdf_projected.buffer(radius_m)
-    gdf_buffer = gdf_projected.to_crs(f"EPSG:{GEODESIC_EPSG}")
-    return gdf_buffer["geometry"].iloc[0]
+    return create_circular_polygons([lat], [lon], radius_m)[0]
 
 
 def groceries_from_placename(
@@ -252,7 +514,7 @@ def groceries_from_point(
         GeoDataFrame: GeoDataFrame containing the grocery POIs.
     """
 
-    gdf = _from_point_helper(lat, lon, radius_m, _make_hashable_tags_helper(PRIMARY))
+    gdf = _point_features(lat, lon, radius_m, _make_hashable_tags_helper(PRIMARY))
     if centroids_only:
         gdf["geometry"] = get_centroids(gdf)
     gdf["label"] = "Grocery"
@@ -275,7 +537,7 @@ def convenience_from_point(
         GeoDataFrame: GeoDataFrame containing the convenience store POIs.
     """
 
-    gdf = _from_point_helper(lat, lon, radius_m, _make_hashable_tags_helper(SECONDARY))
+    gdf = _point_features(lat, lon, radius_m, _make_hashable_tags_helper(SECONDARY))
     if centroids_only:
         gdf["geometry"] = get_centroids(gdf)
     gdf["label"] = "Convenience"
@@ -298,18 +560,127 @@ def lowquality_from_point(
         GeoDataFrame: GeoDataFrame containing the low-quality food POIs.
     """
 
-    gdf = _from_point_helper(lat, lon, radius_m, _make_hashable_tags_helper(TERTIARY))
+    gdf = _point_features(lat, lon, radius_m, _make_hashable_tags_helper(TERTIARY))
     if centroids_only:
         gdf["geometry"] = get_centroids(gdf)
     gdf["label"] = "Low Quality"
     return gdf
 
 
+def _tier_mask(gdf: GeoDataFrame, tags: dict | list[dict]) -> pd.Series:
+    """
+    Flag the features matching any of the tag dictionaries of a tier.
+
+    Args:
+        gdf (GeoDataFrame): OSM features with one column per tag key.
+        tags (dict | list[dict]): Tags of the tier, as in PRIMARY/SECONDARY/TERTIARY.
+
+    Returns:
+        pd.Series: Boolean mask aligned with the features.
+    """
+    mask = pd.Series(False, index=gdf.index)
+    for tag in [tags] if isinstance(tags, dict) else tags:
+        tag_mask = pd.Series(True, index=gdf.index)
+        for key, value in tag.items():
+            if key not in gdf.columns:
+                tag_mask[:] = False
+            else:
+                tag_mask &= gdf[key] == value
+        mask |= tag_mask
+    return mask
+
+
+def _label_food_tiers(gdf: GeoDataFrame, centroids_only: bool) -> GeoDataFrame:
+    """
+    Split the features of a combined query into the food tiers.
+
+    A feature matching several tiers appears once per tier, exactly as if each
+    tier had been queried on its own.
+
+    Args:
+        gdf (GeoDataFrame): Features fetched with ALL_FOOD_TAGS.
+        centroids_only (bool): Whether to return centroids only.
+
+    Returns:
+        GeoDataFrame: The features of every tier with a "label" column.
+    """
+    if centroids_only:
+        gdf["geometry"] = get_centroids(gdf)
+    tiers = []
+    for label, tags in FOOD_TIERS.items():
+        tier = gdf[_tier_mask(gdf, tags)].copy()
+        tier["label"] = label
+        tiers.append(tier)
+    return pd.concat(tiers)
+
+
+def food_pois_from_placename(
+    placename: str, centroids_only: bool = True
+) -> GeoDataFrame:
+    """
+    Retrieve the grocery, convenience and low-quality food POIs of a place in one query.
+
+    Args:
+        placename (str): Name of the place.
+        centroids_only (bool, optional): Whether to return centroids only. Defaults to True.
+
+    Returns:
+        GeoDataFrame: GeoDataFrame containing the POIs, labelled "Grocery",
+            "Convenience" or "Low Quality".
+    """
+    gdf = _from_place_name_helper(placename, _make_hashable_tags_helper(ALL_FOOD_TAGS))
+    return _label_food_tiers(gdf, centroids_only)
+
+
+def food_pois_from_point(
+    lat: float, lon: float, radius_m: int = 10_000, centroids_only: bool = True
+) -> GeoDataFrame:
+    """
+    Retrieve the grocery, convenience and low-quality food POIs around a point in one query.
+
+    Args:
+        lat (float): Latitude of the center point.
+        lon (float): Longitude of the center point.
+        radius_m (int, optional): Radius in meters. Defaults to 10_000.
+        centroids_only (bool, optional): Whether to return centroids only. Defaults to True.
+
+    Returns:
+        GeoDataFrame: GeoDataFrame containing the POIs, labelled "Grocery",
+            "Convenience" or "Low Quality".
+    """
+    gdf = _point_features(lat, lon, radius_m, _make_hashable_tags_helper(ALL_FOOD_TAGS))
+    return _label_food_tiers(gdf, centroids_only)
+
+
+def build_food_poi_snapshot(
+    store_dir: Path = osm_extract.OSM_STORE_DIR,
+    snapshot_path: Path = poi_snapshot.POI_SNAPSHOT_PATH,
+) -> GeoDataFrame:
+    """
+    Build the POI snapshot for point queries from an ingested (national) OSM extract.
+
+    Every feature of the three food tiers is kept, reduced to its centroid.
+
+    Args:
+        store_dir (Path, optional): Directory of the ingested extract.
+        snapshot_path (Path, optional): Destination of the snapshot.
+
+    Returns:
+        GeoDataFrame: The snapshot as written.
+    """
+    pois = osm_extract.load_pois(store_dir)
+    pois = pois[_tier_mask(pois, ALL_FOOD_TAGS)].set_index(["element_type", "osmid"])
+    pois["geometry"] = get_centroids(pois)
+    return poi_snapshot.build_poi_snapshot(
+        pois.dropna(axis=1, how="all"), snapshot_path
+    )
+
+
 def place_to_point(placename):
-    point = ox.geocode(placename)
+    point = geocode(placename)
     return point
 
 
 def place_to_polygon(placename):
-    polygon = ox.geocode_to_gdf(placename)
-    return polygon
\ No newline at end of file
+    polygon = geocode_to_gdf(placename)
+    return polygon
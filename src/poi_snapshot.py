@@ -0,0 +1,168 @@
+import os
+import sys
+from functools import cache
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import shapely
+import geopandas as gpd
+from geopandas import GeoDataFrame
+from osmnx._errors import InsufficientResponseError
+from shapely import STRtree
+
+GEODESIC_EPSG = 4326
+EARTH_RADIUS_M = 6_371_008.8
+POI_SNAPSHOT_PATH = Path("data", "processed", "poi_snapshot.parquet")
+# "query" fetches every point search, "snapshot" answers from the preloaded snapshot
+POI_POINT_BACKEND = os.environ.get("POI_POINT_BACKEND", "query")
+# tag keys kept as plain arrays for matching without pandas
+SNAPSHOT_KEYS = ("shop", "amenity")
+
+if os.getcwd().endswith("notebooks") or os.getcwd().endswith("src"):
+    os.chdir("..")
+
+if "src" not in sys.path:
+    sys.path.append("src")
+
+
+def build_poi_snapshot(
+    pois: GeoDataFrame, snapshot_path: Path = POI_SNAPSHOT_PATH
+) -> GeoDataFrame:
+    """
+    Write a POI snapshot, typically every food POI of the country.
+
+    Args:
+        pois (GeoDataFrame): Point features indexed by (element_type, osmid), with
+            their tags as columns.
+        snapshot_path (Path, optional): Destination of the GeoParquet snapshot.
+
+    Returns:
+        GeoDataFrame: The snapshot as written.
+    """
+    if not (pois.geom_type == "Point").all():
+        raise ValueError("The POI snapshot holds points only, reduce features first")
+    pois = pois.to_crs(epsg=GEODESIC_EPSG)
+    Path(snapshot_path).parent.mkdir(parents=True, exist_ok=True)
+    pois.to_parquet(snapshot_path)
+    _snapshot_index.cache_clear()
+    return pois
+
+
+@cache
+def _snapshot_index(snapshot_path: Path = POI_SNAPSHOT_PATH) -> tuple:
+    """
+    Load the snapshot, its spatial index and plain coordinate and tag arrays once per process.
+    """
+    if not Path(snapshot_path).exists():
+        raise FileNotFoundError(f"No POI snapshot at {snapshot_path}")
+    snapshot = gpd.read_parquet(snapshot_path)
+    points = snapshot.geometry.values
+    tag_values = {
+        key: snapshot[key].to_numpy(dtype=object)
+        for key in SNAPSHOT_KEYS
+        if key in snapshot.columns
+    }
+    return (
+        snapshot,
+        STRtree(points),
+        shapely.get_x(points),
+        shapely.get_y(points),
+        tag_values,
+    )
+
+
+def _matches_tags(
+    tag_values: dict, rows: np.ndarray, hashable_tags: frozenset
+) -> np.ndarray:
+    """
+    Flag the rows matching any of the tags, as osmnx does for a tags dictionary.
+    """
+    mask = np.zeros(len(rows), dtype=bool)
+    for key, value in hashable_tags:
+        if key not in SNAPSHOT_KEYS:
+            raise ValueError(f"The POI snapshot only matches the keys {SNAPSHOT_KEYS}")
+        if key not in tag_values:
+            continue
+        values = tag_values[key][rows]
+        if value is True:
+            mask |= pd.notna(values)
+        else:
+            mask |= np.isin(values, value if isinstance(value, tuple) else [value])
+    return mask
+
+
+def snapshot_rows(
+    lat: float,
+    lon: float,
+    radius_m: float,
+    hashable_tags: frozenset,
+    snapshot_path: Path = POI_SNAPSHOT_PATH,
+) -> np.ndarray:
+    """
+    Find the snapshot POIs within a great-circle distance of a point.
+
+    This is the fast path for scoring many points: a bounding box query on the
+    STRtree, then an exact haversine test of the candidates, all on numpy arrays.
+
+    Args:
+        lat (float): Latitude of the center point.
+        lon (float): Longitude of the center point.
+        radius_m (float): Radius in meters.
+        hashable_tags (frozenset): Tags to match, from _make_hashable_tags_helper.
+        snapshot_path (Path, optional): Location of the snapshot.
+
+    Returns:
+        np.ndarray: Sorted row positions of the matching POIs in the snapshot.
+    """
+    _, tree, lons, lats, tag_values = _snapshot_index(snapshot_path)
+    dlat = np.degrees(radius_m / EARTH_RADIUS_M)
+    dlon = min(dlat / max(np.cos(np.radians(lat)), 1e-9), 180)
+    rows = np.sort(
+        tree.query(shapely.box(lon - dlon, lat - dlat, lon + dlon, lat + dlat))
+    )
+
+    phi, candidate_phi = np.radians(lat), np.radians(lats[rows])
+    haversine = (
+        np.sin((candidate_phi - phi) / 2) ** 2
+        + np.cos(phi)
+        * np.cos(candidate_phi)
+        * np.sin(np.radians(lons[rows] - lon) / 2) ** 2
+    )
+    within = 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(haversine)) <= radius_m
+    rows = rows[within]
+    return rows[_matches_tags(tag_values, rows, hashable_tags)]
+
+
+def features_near_point(
+    lat: float,
+    lon: float,
+    radius_m: float,
+    hashable_tags: frozenset,
+    snapshot_path: Path = POI_SNAPSHOT_PATH,
+) -> GeoDataFrame:
+    """
+    Snapshot equivalent of a point and radius feature query, without network access.
+
+    Args:
+        lat (float): Latitude of the center point.
+        lon (float): Longitude of the center point.
+        radius_m (float): Radius in meters.
+        hashable_tags (frozenset): Tags to match, from _make_hashable_tags_helper.
+        snapshot_path (Path, optional): Location of the snapshot.
+
+    Returns:
+        GeoDataFrame: The matching POIs as points.
+
+    Raises:
+        InsufficientResponseError: If no POI matches, like osmnx.
+    """
+    rows = snapshot_rows(lat, lon, radius_m, hashable_tags, snapshot_path)
+    if len(rows) == 0:
+        raise InsufficientResponseError("No matching POIs in the snapshot.")
+    return _snapshot_index(snapshot_path)[0].iloc[rows].copy()
+
+
+if __name__ == "__main__":
+    from poi_queries import build_food_poi_snapshot
+
+    build_food_poi_snapshot()
@@ -0,0 +1,101 @@
+import os
+import sys
+from functools import cache
+from pathlib import Path
+import numpy as np
+import geopandas as gpd
+from geopandas import GeoDataFrame
+from shapely import STRtree, Point, box
+
+GEODESIC_EPSG = 4326
+STATE_OUTLINE_PATH = Path("data", "processed", "state_outlines.parquet")
+
+if os.getcwd().endswith("notebooks") or os.getcwd().endswith("src"):
+    os.chdir("..")
+
+if "src" not in sys.path:
+    sys.path.append("src")
+
+from census_utils.mappings import get_mapping
+from tract_store import load_tract_store
+
+
+def build_state_outlines(outline_path: Path = STATE_OUTLINE_PATH) -> GeoDataFrame:
+    """
+    Dissolve the tracts in the tract store into one outline per state.
+
+    States are keyed by their FIPS code in the tract data and translated to the
+    two-letter abbreviation through census_utils.mappings.
+
+    Args:
+        outline_path (Path, optional): Destination of the GeoParquet outlines.
+
+    Returns:
+        GeoDataFrame: One row per state with a "state" abbreviation column.
+    """
+    fips_to_short = get_mapping("fips", "short_states")
+    outlines = load_tract_store()[["ST", "geometry"]].dissolve(by="ST").reset_index()
+    outlines["state"] = outlines["ST"].map(fips_to_short)
+    outlines = outlines[["state", "geometry"]].dropna(subset=["state"])
+
+    Path(outline_path).parent.mkdir(parents=True, exist_ok=True)
+    outlines.to_parquet(outline_path, index=False)
+    _state_index.cache_clear()
+    return outlines
+
+
+def load_state_outlines(outline_path: Path = STATE_OUTLINE_PATH) -> GeoDataFrame:
+    """
+    Read the state outlines, building them from the tract store if missing.
+    """
+    if not Path(outline_path).exists():
+        return build_state_outlines(outline_path)
+    return gpd.read_parquet(outline_path)
+
+
+@cache
+def _state_index(outline_path: Path = STATE_OUTLINE_PATH) -> tuple[np.ndarray, STRtree]:
+    """
+    Build the in-memory spatial index over the state outlines once per process.
+    """
+    outlines = load_state_outlines(outline_path)
+    return outlines["state"].to_numpy(), STRtree(outlines.geometry.values)
+
+
+def state_from_point(lat: float, lon: float) -> str | None:
+    """
+    Resolve a coordinate to the two-letter code of the state containing it.
+
+    Only states that are present in the tract store can be resolved.
+
+    Args:
+        lat (float): Latitude of the point.
+        lon (float): Longitude of the point.
+
+    Returns:
+        str | None: The state abbreviation, or None if the point is in no known state.
+    """
+    states, tree = _state_index()
+    hits = tree.query(Point(lon, lat), predicate="intersects")
+    if len(hits) == 0:
+        return None
+    return states[hits[0]]
+
+
+def states_in_bounds(bounds: tuple[float, float, float, float]) -> list[str]:
+    """
+    List the known states whose outline intersects a bounding box.
+
+    Args:
+        bounds (tuple): (minx, miny, maxx, maxy) in longitude and latitude.
+
+    Returns:
+        list[str]: State abbreviations, possibly empty.
+    """
+    states, tree = _state_index()
+    hits = tree.query(box(*bounds), predicate="intersects")
+    return states[np.sort(hits)].tolist()
+
+
+if __name__ == "__main__":
+    build_state_outlines()
@@ -18,6 +18,7 @@ if os.getcwd().endswith("notebooks") or os.getcwd().endswith("src"):
 if "src" not in sys.path:
     sys.path.append("src")
 from poi_queries import create_circular_polygon
+import osm_extract
 
 
 def key_to_max(dictionary: dict) -> any:
@@ -111,13 +112,21 @@ def road_network_from_polygon(polygon) -> nx.MultiDiGraph:
         custom_filter = (
             '["highway"~"motorway|trunk|primary|secondary|tertiary|residential"]'
         )
-        G = ox.graph_from_polygon(
-            polygon,
-            network_type="drive",
-            simplify=True,
-            retain_all=False,
-            custom_filter=custom_filter,
-        )
+        if osm_extract.OSM_BACKEND == "extract":
+            G = osm_extract.graph_from_polygon(
+                polygon,
+                custom_filter=custom_filter,
+                simplify=True,
+                retain_all=False,
+            )
+        else:
+            G = ox.graph_from_polygon(
+                polygon,
+                network_type="drive",
+                simplify=True,
+                retain_all=False,
+                custom_filter=custom_filter,
+            )
         G = ox.project_graph(G, EQUAL_AREA_EPSG)
         # G = ox.simplification.simplify_graph(G)
         G = ox.consolidate_intersections(G)
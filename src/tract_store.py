@@ -0,0 +1,357 @@
+import os
+import sys
+from functools import cache
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from geopandas import GeoDataFrame
+from shapely import STRtree, Point, box
+import mapclassify
+
+GEODESIC_EPSG = 4326
+INVALID_VALUE = -999
+SOURCE_DIR = Path("data")
+TRACT_STORE_PATH = Path("data", "processed", "svi_tracts.parquet")
+STATISTICS_PATH = Path("data", "processed", "svi_statistics.parquet")
+CLASS_COUNT = 8
+# estimates, percentages and percentile rankings, leaving out margins of error and flags
+CLASSIFIED_PREFIXES = ("E_", "EP_", "EPL_", "SPL_", "RPL_", "POP_DENSITY")
+VIEWPORT_MARGIN = 0.1
+# each simplified geometry is used up to its zoom, finer zooms get full resolution
+PYRAMID_ZOOMS = (6, 8, 10, 12)
+
+if os.getcwd().endswith("notebooks") or os.getcwd().endswith("src"):
+    os.chdir("..")
+
+if "src" not in sys.path:
+    sys.path.append("src")
+
+
+def _clean_invalid_values(
+    gdf: GeoDataFrame, invalid_value: int = INVALID_VALUE
+) -> GeoDataFrame:
+    """
+    Replace the SVI sentinel for missing data with nulls in every numeric column.
+
+    Args:
+        gdf (GeoDataFrame): Tract data as read from a state GeoJSON file.
+        invalid_value (int, optional): Sentinel used by the CDC. Defaults to -999.
+
+    Returns:
+        GeoDataFrame: The same tracts with the sentinel replaced by NaN.
+    """
+    numeric_columns = gdf.select_dtypes("number").columns
+    gdf[numeric_columns] = gdf[numeric_columns].mask(
+        gdf[numeric_columns] == invalid_value
+    )
+    return gdf
+
+
+def _pyramid_column(zoom: int) -> str:
+    return f"geometry_z{zoom}"
+
+
+def _simplify_tolerance(zoom: int) -> float:
+    """
+    Half a 256 pixel web map pixel at the given zoom, in degrees of longitude.
+    """
+    return 180 / (256 * 2**zoom)
+
+
+def build_tract_store(
+    source_dir: Path = SOURCE_DIR, store_path: Path = TRACT_STORE_PATH
+) -> GeoDataFrame:
+    """
+    Convert the bundled geo_json_<state>.json files into a single GeoParquet store.
+
+    The sentinel values are converted to nulls and the rows are sorted by state so
+    that a state's tracts form one contiguous slice of the store. POP_DENSITY is
+    derived from E_TOTPOP and AREA_SQMI, and a simplified copy of every geometry is
+    stored for each zoom in PYRAMID_ZOOMS. The classification statistics table is
+    rebuilt alongside the store.
+
+    Args:
+        source_dir (Path, optional): Directory holding the state GeoJSON files.
+        store_path (Path, optional): Destination of the GeoParquet store.
+
+    Returns:
+        GeoDataFrame: The tracts that were written to the store.
+    """
+    frames = [
+        _clean_invalid_values(gpd.read_file(file_path).to_crs(epsg=GEODESIC_EPSG))
+        for file_path in sorted(Path(source_dir).glob("geo_json_*.json"))
+    ]
+    if not frames:
+        raise FileNotFoundError(f"No geo_json_<state>.json files found in {source_dir}")
+
+    tracts = pd.concat(frames, ignore_index=True)
+    tracts = tracts.sort_values(["ST_ABBR", "FIPS"], ignore_index=True)
+    tracts = GeoDataFrame(tracts, geometry="geometry", crs=f"EPSG:{GEODESIC_EPSG}")
+    tracts["POP_DENSITY"] = tracts["E_TOTPOP"] / tracts["AREA_SQMI"]
+    for zoom in PYRAMID_ZOOMS:
+        tracts[_pyramid_column(zoom)] = tracts.geometry.simplify(
+            _simplify_tolerance(zoom), preserve_topology=True
+        )
+
+    Path(store_path).parent.mkdir(parents=True, exist_ok=True)
+    tracts.to_parquet(store_path, index=False)
+    load_tract_store.cache_clear()
+    _state_slices.cache_clear()
+    _state_tree.cache_clear()
+    build_svi_statistics(tracts)
+    return tracts
+
+
+def _natural_breaks(values: np.ndarray, k: int = CLASS_COUNT) -> list[float]:
+    """
+    Jenks natural breaks of the values, as k + 1 edges starting at the minimum.
+
+    Variables with k or fewer distinct values get one class per distinct value.
+    """
+    distinct = np.unique(values)
+    if len(distinct) <= k:
+        return [float(distinct[0])] + distinct.astype(float).tolist()
+    bins = mapclassify.NaturalBreaks(values, k=k).bins
+    return [float(distinct[0])] + np.asarray(bins, dtype=float).tolist()
+
+
+def build_svi_statistics(
+    tracts: GeoDataFrame, statistics_path: Path = STATISTICS_PATH
+) -> pd.DataFrame:
+    """
+    Summarise every mappable SVI variable of every state for choropleth classification.
+
+    Args:
+        tracts (GeoDataFrame): All tracts, as written to the tract store.
+        statistics_path (Path, optional): Destination of the statistics table.
+
+    Returns:
+        pd.DataFrame: One row per state and variable with the minimum, maximum,
+            quantile edges and natural break edges of the non-null values.
+    """
+    rows = []
+    for state, state_tracts in tracts.groupby("ST_ABBR"):
+        variables = [
+            variable
+            for variable in state_tracts.select_dtypes("number").columns
+            if variable.startswith(CLASSIFIED_PREFIXES)
+        ]
+        for variable in variables:
+            values = state_tracts[variable].dropna().to_numpy(dtype=float)
+            if len(values) == 0:
+                continue
+            rows.append(
+                {
+                    "ST_ABBR": state,
+                    "variable": variable,
+                    "count": len(values),
+                    "min": values.min(),
+                    "max": values.max(),
+                    "quantiles": np.quantile(
+                        values, np.linspace(0, 1, CLASS_COUNT + 1)
+                    ).tolist(),
+                    "natural_breaks": _natural_breaks(values),
+                }
+            )
+
+    statistics = pd.DataFrame(rows)
+    Path(statistics_path).parent.mkdir(parents=True, exist_ok=True)
+    statistics.to_parquet(statistics_path, index=False)
+    _statistics_lookup.cache_clear()
+    return statistics
+
+
+@cache
+def _statistics_lookup(statistics_path: Path = STATISTICS_PATH) -> dict:
+    """
+    Index the statistics table by (state, variable) once per process.
+    """
+    if not Path(statistics_path).exists():
+        build_svi_statistics(load_tract_store(), statistics_path)
+    statistics = pd.read_parquet(statistics_path)
+    return {
+        (row["ST_ABBR"], row["variable"]): row
+        for row in statistics.to_dict(orient="records")
+    }
+
+
+def classified_variables(statistics_path: Path = STATISTICS_PATH) -> frozenset:
+    """
+    The SVI variables with statistics in at least one state, i.e. those that can be mapped.
+    """
+    return frozenset(variable for _, variable in _statistics_lookup(statistics_path))
+
+
+def svi_statistics(
+    state: str, variable: str, statistics_path: Path = STATISTICS_PATH
+) -> dict:
+    """
+    Look up the precomputed statistics of one variable in one state.
+
+    Args:
+        state (str): Two-letter state abbreviation, case insensitive.
+        variable (str): Name of the SVI variable.
+        statistics_path (Path, optional): Location of the statistics table.
+
+    Returns:
+        dict: The count, min, max, quantiles and natural_breaks of the variable.
+    """
+    statistics = _statistics_lookup(statistics_path).get((state.upper(), variable))
+    if statistics is None:
+        raise ValueError(f"No statistics for {variable} in state {state}")
+    return statistics
+
+
+@cache
+def load_tract_store(store_path: Path = TRACT_STORE_PATH) -> GeoDataFrame:
+    """
+    Load the tract store once per process, building it first if it is missing.
+
+    Args:
+        store_path (Path, optional): Location of the GeoParquet store.
+
+    Returns:
+        GeoDataFrame: All tracts in the store.
+    """
+    if not Path(store_path).exists():
+        build_tract_store(store_path=store_path)
+    return gpd.read_parquet(store_path, memory_map=True)
+
+
+@cache
+def _state_slices(store_path: Path = TRACT_STORE_PATH) -> dict:
+    """
+    Map each state abbreviation to the row range it occupies in the store.
+    """
+    states = load_tract_store(store_path)["ST_ABBR"]
+    bounds = states.reset_index().groupby("ST_ABBR")["index"].agg(["min", "max"])
+    return {
+        state: slice(start, stop + 1)
+        for state, start, stop in bounds.itertuples(index=True, name=None)
+    }
+
+
+def available_states(store_path: Path = TRACT_STORE_PATH) -> list[str]:
+    """
+    List the two-letter codes of the states held in the store.
+    """
+    return sorted(_state_slices(store_path))
+
+
+def tracts_for_state(state: str, store_path: Path = TRACT_STORE_PATH) -> GeoDataFrame:
+    """
+    Slice the tracts of one state out of the store.
+
+    Args:
+        state (str): Two-letter state abbreviation, case insensitive.
+        store_path (Path, optional): Location of the GeoParquet store.
+
+    Returns:
+        GeoDataFrame: The tracts of the requested state.
+    """
+    rows = _state_slices(store_path).get(state.upper())
+    if rows is None:
+        raise ValueError(f"No tract data available for state {state}")
+    return load_tract_store(store_path).iloc[rows]
+
+
+@cache
+def _state_tree(state: str, store_path: Path = TRACT_STORE_PATH) -> STRtree:
+    """
+    Build the spatial index over one state's tract geometries once per process.
+    """
+    return STRtree(tracts_for_state(state, store_path).geometry.values)
+
+
+def tracts_in_bounds(
+    state: str,
+    bounds: tuple[float, float, float, float],
+    margin: float = VIEWPORT_MARGIN,
+    store_path: Path = TRACT_STORE_PATH,
+) -> GeoDataFrame:
+    """
+    Select the tracts of a state that intersect a bounding box.
+
+    Args:
+        state (str): Two-letter state abbreviation, case insensitive.
+        bounds (tuple): (minx, miny, maxx, maxy) in longitude and latitude.
+        margin (float, optional): Fraction of the box width and height added on
+            every side so that small pans do not expose missing tracts. Defaults to 0.1.
+        store_path (Path, optional): Location of the GeoParquet store.
+
+    Returns:
+        GeoDataFrame: The intersecting tracts, in store order.
+    """
+    minx, miny, maxx, maxy = bounds
+    pad_x, pad_y = (maxx - minx) * margin, (maxy - miny) * margin
+    search_area = box(minx - pad_x, miny - pad_y, maxx + pad_x, maxy + pad_y)
+    hits = _state_tree(state.upper(), store_path).query(
+        search_area, predicate="intersects"
+    )
+    return tracts_for_state(state, store_path).iloc[np.sort(hits)]
+
+
+def tract_at_point(
+    state: str, lat: float, lon: float, store_path: Path = TRACT_STORE_PATH
+) -> pd.Series | None:
+    """
+    Find the tract of a state that contains a point.
+
+    Args:
+        state (str): Two-letter state abbreviation, case insensitive.
+        lat (float): Latitude of the point.
+        lon (float): Longitude of the point.
+        store_path (Path, optional): Location of the GeoParquet store.
+
+    Returns:
+        pd.Series | None: The tract's row, or None if no tract contains the point.
+    """
+    hits = _state_tree(state.upper(), store_path).query(
+        Point(lon, lat), predicate="intersects"
+    )
+    if len(hits) == 0:
+        return None
+    return tracts_for_state(state, store_path).iloc[hits[0]]
+
+
+def tracts_at_zoom(
+    tracts: GeoDataFrame, zoom: float, columns: list[str] | None = None
+) -> GeoDataFrame:
+    """
+    Swap in the simplified geometries suited to a map zoom level.
+
+    Args:
+        tracts (GeoDataFrame): Tracts from the tract store.
+        zoom (float): Zoom level the tracts will be drawn at.
+        columns (list[str], optional): Properties to keep. Defaults to all of them.
+
+    Returns:
+        GeoDataFrame: The tracts with a single "geometry" column at the chosen detail.
+    """
+    level = next((level for level in PYRAMID_ZOOMS if zoom <= level), None)
+    geometry = "geometry" if level is None else _pyramid_column(level)
+    if columns is None:
+        pyramid_columns = [_pyramid_column(level) for level in PYRAMID_ZOOMS]
+        columns = [
+            column
+            for column in tracts.columns
+            if column != "geometry" and column not in pyramid_columns
+        ]
+
+    tracts = GeoDataFrame(tracts[[*columns, geometry]], geometry=geometry)
+    return tracts.rename_geometry("geometry") if geometry != "geometry" else tracts
+
+
+def to_feature_collection(tracts: GeoDataFrame) -> dict:
+    """
+    Convert tracts into a GeoJSON FeatureCollection dictionary with nulls for NaN.
+    """
+    return {
+        "type": "FeatureCollection",
+        "features": list(tracts.iterfeatures(na="null", drop_id=True)),
+    }
+
+
+if __name__ == "__main__":
+    build_tract_store()
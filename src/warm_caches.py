@@ -0,0 +1,162 @@
+import os
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from osmnx._errors import InsufficientResponseError
+
+# Overpass and Nominatim are rate limited, keep the warm-up polite
+WARM_WORKERS = 2
+WARM_PROGRESS_PATH = Path("data", "processed", "cache", "warmup_progress.txt")
+WARM_TILE_ZOOMS = (10, 11, 12)
+
+if os.getcwd().endswith("notebooks") or os.getcwd().endswith("src"):
+    os.chdir("..")
+
+if "src" not in sys.path:
+    sys.path.append("src")
+
+from geocoding import geocode, geocode_to_gdf
+from poi_queries import food_pois_from_placename
+from tract_store import load_tract_store
+from state_resolver import load_state_outlines, state_from_point
+from choropleth_tiles import (
+    CLASSIFICATION_SCHEME,
+    INITIAL_SVI_VARIABLE,
+    tile_path,
+    tiles_in_bounds,
+)
+
+# the tiles a dashboard visitor sees first
+WARM_SVI_VARIABLES = (INITIAL_SVI_VARIABLE,)
+
+
+def warm_place(
+    placename: str,
+    svi_variables: tuple[str, ...] = WARM_SVI_VARIABLES,
+    tile_zooms: tuple[int, ...] = WARM_TILE_ZOOMS,
+) -> None:
+    """
+    Run everything a dashboard search for a place needs once, filling the caches.
+
+    The geocoded point and boundary, the POIs of every food tier and the
+    choropleth tiles over the place's boundary all end up in their on-disk caches.
+
+    Args:
+        placename (str): Name of the place.
+        svi_variables (tuple, optional): SVI variables to render tiles for.
+        tile_zooms (tuple, optional): Zoom levels to render tiles at.
+    """
+    lat, lon = geocode(placename)
+    boundary = geocode_to_gdf(placename)
+    try:
+        food_pois_from_placename(placename)
+    except InsufficientResponseError:
+        pass  # a place without stores is still a finished place
+
+    if state_from_point(lat, lon) is None:
+        return
+    bounds = boundary.total_bounds
+    for z in tile_zooms:
+        for x, y in tiles_in_bounds(bounds, z):
+            for svi_variable in svi_variables:
+                tile_path(svi_variable, z, x, y, scheme=CLASSIFICATION_SCHEME)
+
+
+def warm_caches(
+    placenames: list[str],
+    workers: int = WARM_WORKERS,
+    progress_path: Path = WARM_PROGRESS_PATH,
+    restart: bool = False,
+    svi_variables: tuple[str, ...] = WARM_SVI_VARIABLES,
+    tile_zooms: tuple[int, ...] = WARM_TILE_ZOOMS,
+) -> list[str]:
+    """
+    Warm the caches for many places with bounded concurrency.
+
+    Finished places are appended to a progress file, so an interrupted run picks
+    up where it stopped. Failed places are not recorded and are retried next run.
+
+    Args:
+        placenames (list[str]): Places to warm, e.g. from generate_placenames.
+        workers (int, optional): Places warmed at the same time. Defaults to 2.
+        progress_path (Path, optional): File listing the finished places.
+        restart (bool, optional): Ignore the progress file and warm every place.
+        svi_variables (tuple, optional): SVI variables to render tiles for.
+        tile_zooms (tuple, optional): Zoom levels to render tiles at.
+
+    Returns:
+        list[str]: The places that failed.
+    """
+    Path(progress_path).parent.mkdir(parents=True, exist_ok=True)
+    finished = set()
+    if not restart and Path(progress_path).exists():
+        finished = set(Path(progress_path).read_text().splitlines())
+    remaining = [placename for placename in placenames if placename not in finished]
+    print(f"Warming {len(remaining)} places, {len(finished)} already finished")
+
+    # build any missing stores once, before the workers race to write them
+    load_tract_store()
+    load_state_outlines()
+
+    failed = []
+    with (
+        ThreadPoolExecutor(max_workers=workers) as executor,
+        open(progress_path, "w" if restart else "a") as progress,
+    ):
+        futures = {
+            executor.submit(warm_place, placename, svi_variables, tile_zooms): placename
+            for placename in remaining
+        }
+        for i, future in enumerate(as_completed(futures), start=1):
+            placename = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                print(f"{i}/{len(remaining)} - failed {placename}: {e}")
+                failed.append(placename)
+                continue
+            progress.write(f"{placename}\n")
+            progress.flush()
+            print(f"{i}/{len(remaining)} - warmed {placename}")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Pre-populate the geocode, POI and choropleth tile caches."
+    )
+    parser.add_argument(
+        "--places",
+        type=Path,
+        help="text file with one place name per line, defaults to the CBSA principal cities",
+    )
+    parser.add_argument("--workers", type=int, default=WARM_WORKERS)
+    parser.add_argument("--svi", nargs="+", default=list(WARM_SVI_VARIABLES))
+    parser.add_argument("--zooms", nargs="+", type=int, default=list(WARM_TILE_ZOOMS))
+    parser.add_argument("--progress", type=Path, default=WARM_PROGRESS_PATH)
+    parser.add_argument(
+        "--restart", action="store_true", help="ignore the progress of earlier runs"
+    )
+    args = parser.parse_args()
+
+    if args.places is not None:
+        placenames = [
+            line.strip()
+            for line in args.places.read_text().splitlines()
+            if line.strip()
+        ]
+    else:
+        from data_processing import generate_placenames
+
+        placenames = generate_placenames()
+
+    failed = warm_caches(
+        placenames,
+        workers=args.workers,
+        progress_path=args.progress,
+        restart=args.restart,
+        svi_variables=tuple(args.svi),
+        tile_zooms=tuple(args.zooms),
+    )
+    print(f"Finished with {len(failed)} failed places")